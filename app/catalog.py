@@ -0,0 +1,139 @@
+import weakref
+from typing import Iterable
+
+import numpy as np
+
+from app.eshop import ProductBase, to_cents
+
+
+class CatalogProduct(ProductBase):
+    """Product view of a ProductCatalog row, reads and writes go to the catalog arrays."""
+
+    # the catalog keeps a weakref to the live view of every row
+    __slots__ = ("catalog", "row", "_carts", "__weakref__")
+
+    def __init__(self, catalog: "ProductCatalog", row: int):
+        self.catalog = catalog
+        self.row = row
+        self._carts = None
+
+    @property
+    def name(self):
+        return self.catalog.names[self.row]
+
+    @property
+    def _price_cents(self):
+        return int(self.catalog._prices[self.row])
+
+    @_price_cents.setter
+    def _price_cents(self, price_cents):
+        self.catalog._prices[self.row] = price_cents
+
+    @property
+    def available_amount(self):
+        return int(self.catalog.available_amounts[self.row])
+
+    @available_amount.setter
+    def available_amount(self, available_amount):
+        self.catalog.available_amounts[self.row] = available_amount
+
+
+class _ViewRef(weakref.ref):
+    __slots__ = ("row",)
+
+
+class ProductCatalog:
+    """
+    Products stored column wise: prices in cents and available amounts in numpy arrays,
+    names in a list, and a name -> row index. Product objects are only created as views
+    when they are asked for, one live view per row, so carts see the same object.
+    price_cents is read only, prices change through the views or set_prices, which
+    keep the totals of the carts holding the views.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.names = []
+        self.index = {}
+        self._prices = np.zeros(capacity, dtype=np.int64)
+        self.available_amounts = np.zeros(capacity, dtype=np.int64)
+        # weakref of the live view per row, or None, cleared by one shared callback
+        self._views = []
+        self._view_dropped = self._drop_view
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    @property
+    def price_cents(self) -> np.ndarray:
+        prices = self._prices[:len(self.names)]
+        prices.flags.writeable = False
+        return prices
+
+    @classmethod
+    def from_products(cls, products: Iterable[ProductBase]):
+        catalog = cls()
+        for product in products:
+            catalog.add_cents(product.name, product.price_cents, product.available_amount)
+        return catalog
+
+    def add(self, name: str, price, available_amount: int) -> CatalogProduct:
+        return self.add_cents(name, to_cents(price), available_amount)
+
+    def add_cents(self, name: str, price_cents: int, available_amount: int) -> CatalogProduct:
+        if name in self.index:
+            raise ValueError(f"Product {name} is already in the catalog")
+        row = len(self.names)
+        if row == len(self._prices):
+            # amortized growth, the arrays double when they are full
+            self._prices = np.resize(self._prices, max(2 * row, 1))
+            self.available_amounts = np.resize(self.available_amounts, max(2 * row, 1))
+        self.names.append(name)
+        self._views.append(None)
+        self.index[name] = row
+        self._prices[row] = price_cents
+        self.available_amounts[row] = available_amount
+        return self.product(row)
+
+    def get(self, name: str) -> CatalogProduct:
+        return self.product(self.index[name])
+
+    def product(self, row: int) -> CatalogProduct:
+        view = self._view(row)
+        if view is None:
+            view = CatalogProduct(self, row)
+            ref = self._views[row] = _ViewRef(view, self._view_dropped)
+            ref.row = row
+        return view
+
+    def set_prices(self, rows, price_cents):
+        """Vectorized repricing of rows, the carts holding their products are repriced as well."""
+        changed = np.unique(np.asarray(rows, dtype=np.intp))
+        old_prices = self._prices[changed]
+        self._prices[rows] = price_cents
+        # only products with a live view can be in carts
+        for row, old_price, new_price in zip(changed.tolist(), old_prices.tolist(), self._prices[changed].tolist()):
+            view = self._view(row)
+            if view is not None and view._carts is not None and old_price != new_price:
+                view._prune_carts(old_price, new_price)
+
+    def _drop_view(self, ref):
+        # the slot may hold a newer view already
+        if self._views[ref.row] is ref:
+            self._views[ref.row] = None
+
+    def _view(self, row):
+        ref = self._views[row]
+        return ref() if ref is not None else None
+
+    def rows(self, names: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.index[name] for name in names), dtype=np.intp)
+
+    def are_available(self, names: Iterable[str], amounts) -> np.ndarray:
+        """Product.is_available for many (name, amount) pairs at once."""
+        return self.are_available_rows(self.rows(names), amounts)
+
+    def are_available_rows(self, rows: np.ndarray, amounts) -> np.ndarray:
+        return self.available_amounts[rows] >= np.asarray(amounts)
@@ -1,21 +1,72 @@
-from typing import Dict
-from dataclasses import dataclass
+from typing import Dict, List
+from dataclasses import dataclass, fields
 from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
 
+import sys
 import uuid
+import weakref
 
 from services import ShippingService
 
 
-class Product:
-    available_amount: int
-    name: str
-    price: float
+CENTS = 100
 
-    def __init__(self, name, price, available_amount):
-        self.name = name
-        self.price = price
-        self.available_amount = available_amount
+
+def add_slots(cls, extra_slots: tuple = ()):
+    """
+    Recreates a dataclass with __slots__ for its fields, what dataclass(slots=True)
+    does on Python 3.10+. Defaults are kept by the generated __init__.
+    """
+    field_names = tuple(field.name for field in fields(cls))
+    namespace = {name: value for name, value in cls.__dict__.items()
+                 if name not in field_names and name not in ("__dict__", "__weakref__")}
+    namespace["__slots__"] = field_names + tuple(extra_slots)
+    slotted = type(cls)(cls.__name__, cls.__bases__, namespace)
+    slotted.__qualname__ = cls.__qualname__
+    return slotted
+
+
+def to_cents(price) -> int:
+    """Price in cents, rounded half up. str(price) keeps floats like 0.1 at their shortest decimal form."""
+    return int((Decimal(str(price)) * CENTS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+class _CartRefs(list):
+    """
+    Weak references to the carts holding a product. Carts that drop the product stay
+    until the list is pruned, on price changes and whenever it reached `limit`.
+    """
+
+    __slots__ = ("limit",)
+
+
+class ProductBase:
+    """
+    Product behaviour without storage. Subclasses provide name, _price_cents,
+    available_amount and _carts, the carts holding the product object: None, the
+    weakref of the only cart, or _CartRefs. Carts share one weakref, so a line costs one pointer.
+    """
+
+    __slots__ = ()
+
+    @property
+    def price_cents(self):
+        return self._price_cents
+
+    @price_cents.setter
+    def price_cents(self, price_cents: int):
+        old_price_cents, self._price_cents = self._price_cents, price_cents
+        if self._carts is not None:
+            self._prune_carts(old_price_cents, price_cents)
+
+    @property
+    def price(self) -> float:
+        return self._price_cents / CENTS
+
+    @price.setter
+    def price(self, price):
+        self.price_cents = to_cents(price)
 
     def is_available(self, requested_amount):
         return self.available_amount >= requested_amount
@@ -23,6 +74,40 @@ class Product:
     def buy(self, requested_amount):
         self.available_amount -= requested_amount
 
+    def _subscribe(self, cart):
+        ref = weakref.ref(cart)
+        carts = self._carts
+        if carts is None or carts is ref:
+            self._carts = ref
+            return
+        if type(carts) is not _CartRefs:
+            carts = self._carts = _CartRefs((carts,))
+            carts.limit = 8
+        carts.append(ref)
+        if len(carts) >= carts.limit:
+            self._prune_carts()
+
+    def _unsubscribe(self, cart):
+        # _CartRefs are pruned lazily, a cart ignores price changes of products it no longer holds
+        if self._carts is not None and self._carts is weakref.ref(cart):
+            self._carts = None
+
+    def _prune_carts(self, old_price_cents=None, new_price_cents=None):
+        """Drops the carts that are gone or no longer hold this product, repricing the others."""
+        carts = self._carts
+        held = _CartRefs()
+        seen = set()
+        for ref in (carts if type(carts) is _CartRefs else (carts,)):
+            cart = ref()
+            if cart is None or id(ref) in seen or not cart._holds(self):
+                continue
+            seen.add(id(ref))
+            held.append(ref)
+            if old_price_cents is not None:
+                cart._reprice(self, old_price_cents, new_price_cents)
+        held.limit = max(2 * len(held), 8)
+        self._carts = held if len(held) > 1 else held[0] if held else None
+
     def __eq__(self, other):
         return self.name == other.name
     def __ne__(self, other):
@@ -31,29 +116,76 @@ class Product:
         return hash(self.name)
     def __str__(self):
         return self.name
+class Product(ProductBase):
+    # __dict__ is only allocated when an attribute outside the slots is set, e.g. a mocked method
+    __slots__ = ("name", "_price_cents", "available_amount", "_carts", "__dict__")
+
+    available_amount: int
+    name: str
+    price_cents: int
+
+    def __init__(self, name, price, available_amount):
+        # carts and catalogs hold millions of products with a few thousand distinct names
+        self.name = sys.intern(name) if type(name) is str else name
+        self._price_cents = to_cents(price)
+        self.available_amount = available_amount
+        self._carts = None
 class ShoppingCart:
-    products: Dict[Product, int]
+    # products weakly reference the carts holding them
+    __slots__ = ("products", "_lines", "total_cents", "item_count", "__weakref__")
+
+    # change it through add_product, remove_product and submit_cart_order only, they keep the totals
+    products: Dict[ProductBase, int]
     def __init__(self):
         self.products = dict()
+        # the product object of every line, an equal product object finds the line price through it
+        self._lines: Dict[ProductBase, ProductBase] = dict()
+        self.total_cents = 0
+        self.item_count = 0
+    @property
+    def total(self) -> float:
+        return self.total_cents / CENTS
     def contains_product(self, product):
         return product in self.products
     def calculate_total(self):
-        return sum([p.price * count for p, count in self.products.items()])
-    def add_product(self, product: Product, amount: int):
+        return self.total_cents / CENTS
+    def calculate_total_cents(self):
+        return self.total_cents
+    def add_product(self, product: ProductBase, amount: int):
         if not product.is_available(amount):
             raise ValueError(f"Product {product} has only {product.available_amount} items")
+        # an equal product object already in the cart stays the key, as dict assignment keeps it
+        line_product = self._lines.get(product)
+        if line_product is None:
+            line_product = self._lines[product] = product
+            product._subscribe(self)
+        previous_amount = self.products.get(product, 0)
         self.products[product] = amount
+        self.total_cents += line_product.price_cents * (amount - previous_amount)
+        self.item_count += amount - previous_amount
     def remove_product(self, product):
-        if product in self.products:
-            del self.products[product]
+        line_product = self._lines.pop(product, None)
+        if line_product is not None:
+            amount = self.products.pop(product)
+            self.total_cents -= line_product.price_cents * amount
+            self.item_count -= amount
+            line_product._unsubscribe(self)
     def submit_cart_order(self):
         product_ids = []
         for product, count in self.products.items():
             product.buy(count)
             product_ids.append(str(product))
+            product._unsubscribe(self)
         self.products.clear()
+        self._lines.clear()
+        self.total_cents = 0
+        self.item_count = 0
 
         return product_ids
+    def _holds(self, product):
+        return self._lines.get(product) is product
+    def _reprice(self, product, old_price_cents, new_price_cents):
+        self.total_cents += (new_price_cents - old_price_cents) * self.products[product]
 
 @dataclass
 class Order:
@@ -66,12 +198,37 @@ class Order:
             due_date = datetime.now(timezone.utc) + timedelta(seconds=3)
         product_ids = self.cart.submit_cart_order()
         print(due_date)
-        return self.shipping_service.create_shipping(shipping_type, product_ids, self.order_id, due_date)
+        shipping_id = self.shipping_service.create_shipping(shipping_type, product_ids, self.order_id, due_date)
+        # the next access of shipments reloads them
+        self._shipments = None
+        return shipping_id
+
+    @property
+    def shipments(self) -> List["Shipment"]:
+        """Shipments of the order, loaded on first access with one query and one batched status read."""
+        shipments = getattr(self, "_shipments", None)
+        if shipments is None:
+            shipping_ids = self.shipping_service.find_shipping_ids_by_order(self.order_id)
+            statuses = self.shipping_service.check_statuses(shipping_ids)
+            shipments = self._shipments = [
+                Shipment(shipping_id, self.shipping_service, statuses[shipping_id])
+                for shipping_id in shipping_ids if shipping_id in statuses
+            ]
+        return shipments
+
+
+Order = add_slots(Order, ("_shipments",))
+
 
 @dataclass()
 class Shipment:
     shipping_id: str
     shipping_service: ShippingService
+    # status when the shipment was loaded, check_shipping_status reads the current one
+    status: str = None
 
     def check_shipping_status(self):
         return self.shipping_service.check_status(self.shipping_id)
+
+
+Shipment = add_slots(Shipment)
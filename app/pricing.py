@@ -0,0 +1,73 @@
+from typing import Iterable, List
+
+import numpy as np
+
+from app.eshop import CENTS, Product, ShoppingCart
+
+
+class CartPricingBatch:
+    """
+    Many carts flattened into line arrays (product index, quantity, cart index) that are
+    priced against a vector of product prices in cents in one vectorized pass. Products
+    are told apart by identity, as every cart prices a line by the product object it holds.
+    """
+
+    def __init__(self, carts: Iterable[ShoppingCart]):
+        product_indexes = {}
+        products = []
+        line_products = []
+        line_quantities = []
+        line_counts = []
+        for cart in carts:
+            line_counts.append(len(cart.products))
+            for product, amount in cart.products.items():
+                index = product_indexes.setdefault(id(product), len(product_indexes))
+                if index == len(products):
+                    products.append(product)
+                line_products.append(index)
+                line_quantities.append(amount)
+
+        # the batch keeps the products alive, so their ids stay unique
+        self.products: List[Product] = products
+        self._product_indexes = product_indexes
+        self.product_index = np.array(line_products, dtype=np.intp)
+        self.quantities = np.array(line_quantities, dtype=np.int64)
+        self.line_counts = np.array(line_counts, dtype=np.intp)
+        # first line of every cart, lines of a cart are contiguous
+        self.offsets = np.concatenate(([0], np.cumsum(self.line_counts)[:-1])).astype(np.intp)
+        # reduceat needs the increasing offsets of the carts that have lines
+        self._filled = self.line_counts > 0
+        self._filled_offsets = self.offsets[self._filled]
+
+    def __len__(self):
+        return len(self.line_counts)
+
+    def index_of(self, product: Product) -> int:
+        return self._product_indexes[id(product)]
+
+    def price_vector(self) -> np.ndarray:
+        """Current prices in cents, a copy that can be changed for what-if repricing."""
+        return np.fromiter((product.price_cents for product in self.products), dtype=np.int64, count=len(self.products))
+
+    def totals_cents(self, prices: np.ndarray = None) -> np.ndarray:
+        """Exact total of every cart in cents, with the current prices or the given price vector."""
+        if prices is None:
+            prices = self.price_vector()
+        if len(self.quantities) == 0:
+            return np.zeros(len(self.line_counts), dtype=np.int64)
+        line_totals = np.take(np.asarray(prices, dtype=np.int64), self.product_index)
+        line_totals *= self.quantities
+        cart_totals = np.add.reduceat(line_totals, self._filled_offsets)
+        if len(cart_totals) == len(self.line_counts):
+            return cart_totals
+        totals = np.zeros(len(self.line_counts), dtype=np.int64)
+        totals[self._filled] = cart_totals
+        return totals
+
+    def totals(self, prices: np.ndarray = None) -> np.ndarray:
+        return self.totals_cents(prices) / CENTS
+
+
+def price_carts(carts: Iterable[ShoppingCart]) -> np.ndarray:
+    """Totals of many carts in cents, see CartPricingBatch."""
+    return CartPricingBatch(carts).totals_cents()
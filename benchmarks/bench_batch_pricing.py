@@ -0,0 +1,74 @@
+"""
+Totals of many carts: a calculate_total style loop over every cart against one
+vectorized CartPricingBatch pass, for the current prices and a what-if price vector.
+
+Flattening the carts is a per line Python loop that costs more than the loop it
+replaces, so one-off pricing is slower end to end. The batch pays off when it is
+kept and priced again, e.g. for what-if prices.
+
+    python -m benchmarks.bench_batch_pricing
+"""
+import random
+import time
+
+from app.eshop import Product, ShoppingCart
+from app.pricing import CartPricingBatch, price_carts
+
+CARTS = 200000
+PRODUCTS = 5000
+LINES_PER_CART = 5
+
+
+def _loop_totals(carts, prices=None):
+    # re-sums every line per cart, the per cart loop the batch replaces
+    if prices is None:
+        return [sum([product.price_cents * count for product, count in cart.products.items()]) for cart in carts]
+    return [sum([prices[id(product)] * count for product, count in cart.products.items()]) for cart in carts]
+
+
+def _timed(call, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    random.seed(1)
+    products = [Product(name=f"product-{index}", price=random.randint(1, 100000) / 100, available_amount=10 ** 9)
+                for index in range(PRODUCTS)]
+    carts = []
+    for _ in range(CARTS):
+        cart = ShoppingCart()
+        for product in random.sample(products, LINES_PER_CART):
+            cart.add_product(product, random.randint(1, 5))
+        carts.append(cart)
+
+    loop_seconds, expected = _timed(lambda: _loop_totals(carts))
+    kept_seconds, _ = _timed(lambda: [cart.calculate_total_cents() for cart in carts])
+    build_seconds, batch = _timed(lambda: CartPricingBatch(carts))
+    batch_seconds, totals = _timed(batch.totals_cents)
+    end_to_end_seconds, _ = _timed(lambda: price_carts(carts))
+    assert totals.tolist() == expected
+    print(f"{CARTS} carts, {CARTS * LINES_PER_CART} lines")
+    print(f"per cart loop        {loop_seconds * 1e3:8.1f} ms")
+    print(f"kept cart totals     {kept_seconds * 1e3:8.1f} ms  (no repricing, see ShoppingCart.total_cents)")
+    print(f"flatten              {build_seconds * 1e3:8.1f} ms")
+    print(f"vectorized totals    {batch_seconds * 1e3:8.1f} ms  ({loop_seconds / batch_seconds:.0f}x, batch kept between runs)")
+    print(f"flatten + totals     {end_to_end_seconds * 1e3:8.1f} ms  ({loop_seconds / end_to_end_seconds:.1f}x end to end)")
+
+    prices = batch.price_vector()
+    prices[::2] = prices[::2] * 9 // 10
+    what_if = {id(product): int(prices[batch.index_of(product)]) for product in batch.products}
+    loop_seconds, expected = _timed(lambda: _loop_totals(carts, what_if))
+    batch_seconds, totals = _timed(lambda: batch.totals_cents(prices))
+    assert totals.tolist() == expected
+    print(f"what-if loop         {loop_seconds * 1e3:8.1f} ms")
+    print(f"what-if vectorized   {batch_seconds * 1e3:8.1f} ms  ({loop_seconds / batch_seconds:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
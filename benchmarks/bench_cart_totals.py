@@ -0,0 +1,41 @@
+"""
+ShoppingCart.calculate_total with incrementally kept totals against re-summing
+every line on each call, as calculate_total did before.
+
+    python -m benchmarks.bench_cart_totals
+"""
+import timeit
+
+from app.eshop import Product, ShoppingCart
+
+LINES = [10, 1000, 10000]
+CALLS = 200
+
+
+def _resum(cart):
+    return sum([p.price * count for p, count in cart.products.items()])
+
+
+def main():
+    for lines in LINES:
+        cart = ShoppingCart()
+        for index in range(lines):
+            cart.add_product(Product(name=f"product-{index}", price=index % 100 + 0.99, available_amount=10), 3)
+        before = timeit.timeit(lambda: _resum(cart), number=CALLS) / CALLS
+        after = timeit.timeit(cart.calculate_total, number=CALLS) / CALLS
+        print(f"{lines:>6} lines  re-sum {before * 1e6:10.2f} us  incremental {after * 1e6:6.2f} us  ({before / after:,.0f}x)")
+
+    cart = ShoppingCart()
+    products = [Product(name=f"product-{index}", price=1.99, available_amount=10) for index in range(LINES[-1])]
+    add_seconds = timeit.timeit(lambda: [cart.add_product(product, 1) for product in products], number=1)
+    print(f"add_product {add_seconds / len(products) * 1e6:.2f} us/line, "
+          f"price change {timeit.timeit(lambda: setattr(products[0], 'price', 2.49), number=CALLS) / CALLS * 1e6:.2f} us")
+
+    # products rebuilt from a request are equal to, but not the objects held by the cart
+    rebuilt = Product(name=products[-1].name, price=1.99, available_amount=10)
+    update_seconds = timeit.timeit(lambda: (cart.remove_product(rebuilt), cart.add_product(rebuilt, 1)), number=CALLS)
+    print(f"remove + add of an equal product object {update_seconds / CALLS * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Memory held by the domain objects, measured with tracemalloc.
+
+    python -m benchmarks.bench_memory
+"""
+import gc
+import tracemalloc
+
+from app.catalog import ProductCatalog
+from app.eshop import Order, Product, Shipment, ShoppingCart, to_cents
+
+PRODUCTS = 200000
+# distinct names of the products, names are built at runtime like names read from a request
+DISTINCT_NAMES = 1000
+
+
+class _DictProduct:
+    """Product before __slots__, attributes in a per instance __dict__."""
+
+    def __init__(self, name, price_cents, available_amount):
+        self.name = name
+        self._price_cents = price_cents
+        self.available_amount = available_amount
+        self._carts = None
+
+
+class _DictShoppingCart:
+    def __init__(self):
+        self.products = dict()
+        self.total_cents = 0
+        self.item_count = 0
+
+
+class _DictOrder:
+    def __init__(self, cart, shipping_service, order_id):
+        self.cart = cart
+        self.shipping_service = shipping_service
+        self.order_id = order_id
+
+
+class _DictShipment:
+    def __init__(self, shipping_id, shipping_service, status):
+        self.shipping_id = shipping_id
+        self.shipping_service = shipping_service
+        self.status = status
+
+
+def _allocated(build):
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, kept
+
+
+def main():
+    objects_per_class()
+    print()
+    cart_lines()
+    print()
+    catalog_vs_objects()
+
+
+def objects_per_class():
+    cart = ShoppingCart()
+    rows = [
+        # names are built inside the measurement, equal names share one string once interned
+        ("Product (names included)",
+         lambda: [_DictProduct(_name(index), to_cents(9.99), 10) for index in range(PRODUCTS)],
+         lambda: [Product(_name(index), 9.99, 10) for index in range(PRODUCTS)]),
+        ("ShoppingCart",
+         lambda: [_DictShoppingCart() for _ in range(PRODUCTS)],
+         lambda: [ShoppingCart() for _ in range(PRODUCTS)]),
+        ("Order",
+         lambda: [_DictOrder(cart, None, "order") for _ in range(PRODUCTS)],
+         lambda: [Order(cart, None, "order") for _ in range(PRODUCTS)]),
+        ("Shipment",
+         lambda: [_DictShipment("shipping", None, "created") for _ in range(PRODUCTS)],
+         lambda: [Shipment("shipping", None, "created") for _ in range(PRODUCTS)]),
+    ]
+    print(f"{PRODUCTS} objects each, {DISTINCT_NAMES} distinct product names")
+    print(f"{'':26}{'__dict__':>10}{'__slots__':>11}  bytes/object")
+    for label, before, after in rows:
+        dict_size, _ = _allocated(before)
+        slots_size, _ = _allocated(after)
+        print(f"{label:26}{dict_size / PRODUCTS:10.1f}{slots_size / PRODUCTS:11.1f}"
+              f"  ({dict_size / slots_size:.1f}x less)")
+
+
+def cart_lines():
+    """Cost of putting products into carts: the cart line and the price subscription of the product."""
+    products = [Product(_name(index), 9.99, 10 ** 9) for index in range(DISTINCT_NAMES)]
+    carts = [ShoppingCart() for _ in range(PRODUCTS // 10)]
+
+    def fill():
+        for index, cart in enumerate(carts):
+            for line in range(10):
+                cart.add_product(products[(index + line * 97) % DISTINCT_NAMES], 1)
+
+    size, _ = _allocated(fill)
+    print(f"{len(carts)} carts with 10 lines each, products and empty carts not counted")
+    print(f"products held in carts    {size / (len(carts) * 10):8.1f} bytes/line")
+
+
+def _name(index):
+    return "product-" + str(index % DISTINCT_NAMES)
+
+
+def catalog_vs_objects():
+    names = [f"product-{index:08d}" for index in range(PRODUCTS)]
+
+    objects, _ = _allocated(lambda: {name: Product(name, 9.99, 10) for name in names})
+    catalog, kept = _allocated(lambda: _catalog(names))
+    # views that are held, e.g. by carts, with their entry in the catalog's view cache
+    views, _ = _allocated(lambda: [kept.product(row) for row in range(PRODUCTS)])
+    print(f"{PRODUCTS} products, names not counted")
+    print(f"Product objects + dict  {objects / PRODUCTS:8.1f} bytes/product")
+    print(f"ProductCatalog          {catalog / PRODUCTS:8.1f} bytes/product ({objects / catalog:.1f}x less)")
+    print(f"held CatalogProduct     {views / PRODUCTS:8.1f} bytes/view")
+
+
+def _catalog(names):
+    catalog = ProductCatalog(capacity=len(names))
+    for name in names:
+        catalog.add_cents(name, 999, 10)
+    return catalog
+
+
+if __name__ == "__main__":
+    main()
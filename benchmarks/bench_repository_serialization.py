@@ -0,0 +1,66 @@
+"""
+CPU cost per operation of ShippingRepository (resource API) and
+ClientShippingRepository (low-level client). DynamoDB is replaced by a botocore
+Stubber, so only request building, (de)serialization and dispatch are measured.
+
+    python -m benchmarks.bench_repository_serialization
+"""
+import copy
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from botocore.stub import Stubber
+
+from services.client_repository import ClientShippingRepository, serialize_shipping
+from services.repository import ShippingRepository
+
+ROUNDS = 2000
+
+
+def _item(repository):
+    return repository._build_shipping_item(
+        "Нова Пошта", [f"product-{i}" for i in range(20)], "order-1", "in progress",
+        datetime.now(timezone.utc) + timedelta(days=1)
+    )
+
+
+def _bench(name, client, operation, response, call):
+    with Stubber(client) as stubber:
+        for _ in range(ROUNDS):
+            # the resource client deserializes responses in place
+            stubber.add_response(operation, copy.deepcopy(response))
+        seconds = timeit.timeit(call, number=ROUNDS)
+    print(f"{name:<45} {seconds / ROUNDS * 1e6:8.1f} us/op")
+    return seconds / ROUNDS
+
+
+def main():
+    resource_repository = ShippingRepository()
+    client_repository = ClientShippingRepository()
+    item = _item(resource_repository)
+    shipping_id = item["shipping_id"]
+    get_response = {"Item": serialize_shipping(item)}
+
+    before = _bench("resource get_shipping", resource_repository.client, "get_item", get_response,
+                    lambda: resource_repository.get_shipping(shipping_id))
+    after = _bench("client get_shipping", client_repository.raw_client, "get_item", get_response,
+                   lambda: client_repository.get_shipping(shipping_id))
+    print(f"{'saved per get_shipping':<45} {(before - after) * 1e6:8.1f} us ({before / after:.1f}x)")
+
+    before = _bench("resource update_shipping_status", resource_repository.client, "update_item", {},
+                    lambda: resource_repository.update_shipping_status(shipping_id, "completed"))
+    after = _bench("client update_shipping_status", client_repository.raw_client, "update_item", {},
+                   lambda: client_repository.update_shipping_status(shipping_id, "completed"))
+    print(f"{'saved per update_shipping_status':<45} {(before - after) * 1e6:8.1f} us ({before / after:.1f}x)")
+
+    batch = {"Responses": {resource_repository.table.name: [serialize_shipping(_item(resource_repository)) for _ in range(10)]}}
+    ids = [f"shipping-{i}" for i in range(10)]
+    before = _bench("resource get_shippings (10 items)", resource_repository.client, "batch_get_item", batch,
+                    lambda: resource_repository.get_shippings(ids))
+    after = _bench("client get_shippings (10 items)", client_repository.raw_client, "batch_get_item", batch,
+                   lambda: client_repository.get_shippings(ids))
+    print(f"{'saved per get_shippings':<45} {(before - after) * 1e6:8.1f} us ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
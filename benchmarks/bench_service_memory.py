@@ -0,0 +1,60 @@
+"""
+ShippingService on the in-memory backend: order placement and batch processing
+without network or Docker, a baseline for profiling the service itself.
+--backend sqlite measures the SQLite repository (in a temporary database) instead.
+
+    python -m benchmarks.bench_service_memory
+    python -m benchmarks.bench_service_memory --backend sqlite
+    python -m cProfile -s cumtime -m benchmarks.bench_service_memory
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from services import ShippingService
+from services.backends import create_repository, create_publisher
+from services.sqlite_repository import SqliteShippingRepository
+
+SHIPPINGS = 20000
+
+
+def _report(name, seconds, count):
+    print(f"{name:<45} {seconds / count * 1e6:8.1f} us/op {count / seconds:10.0f} ops/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    args = parser.parse_args(argv)
+
+    if args.backend == "sqlite":
+        with tempfile.TemporaryDirectory() as directory:
+            repository = SqliteShippingRepository(os.path.join(directory, "shipping.db"))
+            _run(ShippingService(repository, create_publisher("sqlite")))
+            repository.close()
+    else:
+        _run(ShippingService(create_repository("memory"), create_publisher("memory")))
+
+
+def _run(shipping_service):
+    shipping_service.publisher.wait_time = 0
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+
+    start = time.perf_counter()
+    for _ in range(SHIPPINGS):
+        shipping_service.create_shipping("Нова Пошта", ["Laptop", "Phone"], str(uuid.uuid4()), due_date)
+    _report("create_shipping", time.perf_counter() - start, SHIPPINGS)
+
+    start = time.perf_counter()
+    processed = 0
+    while processed < SHIPPINGS:
+        processed += len(shipping_service.process_shipping_batch())
+    _report("process_shipping_batch (per shipping)", time.perf_counter() - start, processed)
+    shipping_service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+from .config import SHIPPING_BACKEND, SHIPPING_WRITE_BEHIND
+
+
+def create_repository(backend: str = None, write_behind: bool = None):
+    """Shipping repository of the configured SHIPPING_BACKEND, behind a write-behind buffer with SHIPPING_WRITE_BEHIND."""
+    repository = _create_repository(backend or SHIPPING_BACKEND)
+    if SHIPPING_WRITE_BEHIND if write_behind is None else write_behind:
+        from .write_behind import WriteBehindShippingRepository
+        return WriteBehindShippingRepository(repository)
+    return repository
+
+
+def _create_repository(backend):
+    if backend == "aws":
+        from .repository import ShippingRepository
+        return ShippingRepository()
+    if backend == "memory":
+        from .memory import MemoryShippingRepository
+        return MemoryShippingRepository()
+    if backend == "sqlite":
+        from .sqlite_repository import SqliteShippingRepository
+        return SqliteShippingRepository()
+    raise ValueError(f"Unknown shipping backend {backend!r}")
+
+
+def create_publisher(backend: str = None):
+    """Shipping publisher of the configured SHIPPING_BACKEND."""
+    backend = backend or SHIPPING_BACKEND
+    if backend == "aws":
+        from .publisher import ShippingPublisher
+        return ShippingPublisher()
+    if backend in ("memory", "sqlite"):
+        # the queue lives in the process, the worker has to run in the process that places orders
+        from .memory import MemoryShippingPublisher
+        return MemoryShippingPublisher()
+    raise ValueError(f"Unknown shipping backend {backend!r}")
@@ -0,0 +1,134 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
+import threading
+import time
+
+from .repository import ShippingRepository
+from .dates import decode_date, encode_date, DATE_FORMAT_EPOCH
+
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket shared by all scan segments, keeps the backfill below a write budget."""
+
+    def __init__(self, rate: float, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = rate
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class ShippingDateBackfill:
+    """
+    Rewrites ISO due_date/created_date strings as epoch numbers with a parallel scan and
+    sets due_epoch where it is missing. Each update is conditional on the dates it read,
+    so items changed by the service meanwhile are skipped instead of overwritten.
+    """
+
+    def __init__(self, repository: ShippingRepository, segments: int = 4, writes_per_second: float = 100,
+                 page_size: int = 100, dry_run: bool = False):
+        self.repository = repository
+        self.segments = segments
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self.limiter = RateLimiter(writes_per_second)
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.segments) as executor:
+            counts = list(executor.map(self._backfill_segment, range(self.segments)))
+        return {
+            "scanned": sum(count["scanned"] for count in counts),
+            "updated": sum(count["updated"] for count in counts),
+            "skipped": sum(count["skipped"] for count in counts)
+        }
+
+    def _backfill_segment(self, segment):
+        client = self.repository.client
+        counts = {"scanned": 0, "updated": 0, "skipped": 0}
+        kwargs = {
+            "TableName": self.repository.table.name,
+            "Segment": segment,
+            "TotalSegments": self.segments,
+            "Limit": self.page_size,
+            "ProjectionExpression": "shipping_id, due_date, created_date, due_epoch"
+        }
+        while True:
+            response = client.scan(**kwargs)
+            for item in response.get("Items", []):
+                counts["scanned"] += 1
+                update = self.build_update(item)
+                if update is None:
+                    continue
+                if self.dry_run:
+                    counts["updated"] += 1
+                    continue
+                self.limiter.acquire()
+                try:
+                    client.update_item(TableName=self.repository.table.name, **update)
+                    counts["updated"] += 1
+                except client.exceptions.ConditionalCheckFailedException:
+                    counts["skipped"] += 1
+            if "LastEvaluatedKey" not in response:
+                return counts
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @staticmethod
+    def build_update(item: dict):
+        # an item deleted since the scan must not come back as a stub
+        updates, conditions, values = [], ["attribute_exists(shipping_id)"], {}
+        for name in ("due_date", "created_date"):
+            if isinstance(item.get(name), str):
+                updates.append(f"{name} = :new_{name}")
+                conditions.append(f"{name} = :old_{name}")
+                values[f":new_{name}"] = encode_date(decode_date(item[name]), DATE_FORMAT_EPOCH)
+                values[f":old_{name}"] = item[name]
+        if "due_epoch" not in item and "due_date" in item:
+            updates.append("due_epoch = :due_epoch")
+            values[":due_epoch"] = math.ceil(decode_date(item["due_date"]).timestamp())
+        if not updates:
+            return None
+        update = {
+            "Key": {"shipping_id": item["shipping_id"]},
+            "UpdateExpression": "SET " + ", ".join(updates),
+            "ExpressionAttributeValues": values,
+            "ConditionExpression": " AND ".join(conditions)
+        }
+        return update
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rewrite ISO shipping dates as epoch numbers")
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments")
+    parser.add_argument("--writes-per-second", type=float, default=100)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--dry-run", action="store_true", help="count the items without updating them")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    backfill = ShippingDateBackfill(
+        ShippingRepository(), segments=args.segments, writes_per_second=args.writes_per_second,
+        page_size=args.page_size, dry_run=args.dry_run
+    )
+    logger.info("Backfill finished: %s", backfill.run())
+
+
+if __name__ == "__main__":
+    main()
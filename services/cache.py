@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .config import SHIPPING_CACHE_SIZE, SHIPPING_CACHE_TTL
+
+
+class TTLCache:
+    """Thread safe LRU cache whose entries also expire `ttl` seconds after they were set."""
+
+    def __init__(self, max_size: int, ttl: float, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # generation of the latest invalidation per key, the oldest are forgotten beyond max_size
+        self._generation = 0
+        self._invalidated = OrderedDict()
+        self._forgotten = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        value = self.peek(key, default)
+        with self._lock:
+            if value is default:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def peek(self, key, default=None):
+        """Like get, without counting a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+            return default
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def generation(self):
+        """Token for set(): a value read after taking it is not stored once its key was invalidated meanwhile."""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, generation: int = None):
+        """Returns whether the value was stored."""
+        with self._lock:
+            if generation is not None and (generation < self._forgotten or self._invalidated.get(key, 0) > generation):
+                return False
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+            self._invalidated[key] = self._generation
+            self._invalidated.move_to_end(key)
+            if len(self._invalidated) > self.max_size:
+                _, self._forgotten = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedShippingRepository:
+    """
+    Read-through cache in front of a ShippingRepository. Writes made through it
+    invalidate the cached shippings, also when they race with a read, writes from
+    other processes show up after at most `ttl` seconds. Callers get their own copy
+    of the items. Everything else is delegated to the repository.
+    """
+
+    def __init__(self, repository, max_size: int = SHIPPING_CACHE_SIZE, ttl: float = SHIPPING_CACHE_TTL):
+        self.repository = repository
+        self.cache = TTLCache(max_size, ttl)
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    def get_shipping(self, shipping_id, fields: list = None, consistent_read: bool = False):
+        key = self._fields_key(fields)
+        # one entry per shipping maps projections to the items read with them
+        projections = self.cache.peek(shipping_id)
+        if not consistent_read and projections is not None:
+            shipping = self._from_projections(projections, key)
+            if shipping is not None:
+                self.cache.record(hit=True)
+                return shipping
+        self.cache.record(hit=False)
+
+        generation = self.cache.generation()
+        shipping = self.repository.get_shipping(shipping_id, fields, consistent_read)
+        if shipping is not None:
+            self._store(shipping_id, projections, key, shipping, generation)
+        return shipping
+
+    def get_shippings(self, shipping_ids, fields: list = None, *args, **kwargs):
+        key = self._fields_key(fields)
+        shippings = {}
+        missing = {}
+        for shipping_id in dict.fromkeys(shipping_ids):
+            projections = self.cache.peek(shipping_id)
+            shipping = self._from_projections(projections, key) if projections is not None else None
+            self.cache.record(hit=shipping is not None)
+            if shipping is None:
+                missing[shipping_id] = projections
+            else:
+                shippings[shipping_id] = shipping
+        if missing:
+            generation = self.cache.generation()
+            loaded = self.repository.get_shippings(list(missing), fields, *args, **kwargs)
+            for shipping_id, shipping in loaded.items():
+                self._store(shipping_id, missing[shipping_id], key, shipping, generation)
+            shippings.update(loaded)
+        return shippings
+
+    def update_shipping_status(self, shipping_id, status):
+        try:
+            return self.repository.update_shipping_status(shipping_id, status)
+        finally:
+            self.cache.invalidate(shipping_id)
+
+    def update_shipping_status_if(self, shipping_id, status, expected_status):
+        try:
+            return self.repository.update_shipping_status_if(shipping_id, status, expected_status)
+        finally:
+            self.cache.invalidate(shipping_id)
+
+    def put_shippings(self, items: list):
+        try:
+            return self.repository.put_shippings(items)
+        finally:
+            for item in items:
+                self.cache.invalidate(item["shipping_id"])
+
+    def stats(self):
+        return self.cache.stats()
+
+    def _store(self, shipping_id, projections, key, shipping, generation):
+        # the cache keeps its own copy, callers may change the returned item
+        shipping = dict(shipping)
+        if projections is None:
+            self.cache.set(shipping_id, {key: shipping}, generation)
+        elif self.cache.peek(shipping_id) is projections:
+            # the new projection expires together with the ones already cached
+            projections[key] = shipping
+
+    @staticmethod
+    def _fields_key(fields):
+        return tuple(sorted(fields)) if fields else None
+
+    @staticmethod
+    def _from_projections(projections, key):
+        if key in projections:
+            return dict(projections[key])
+        full_item = projections.get(None)
+        if full_item is not None:
+            return {field: full_item[field] for field in key if field in full_item}
+        return None
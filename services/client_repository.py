@@ -0,0 +1,119 @@
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+from .db import get_client
+from .repository import ShippingRepository, batch_write_items
+
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def serialize_shipping(item: dict):
+    # the shipping schema only holds strings and numbers (dates may be either), anything
+    # else goes through the generic serializer
+    serialized = {}
+    for name, value in item.items():
+        value_type = type(value)
+        if value_type is str:
+            serialized[name] = {"S": value}
+        elif value_type is int or value_type is Decimal:
+            serialized[name] = {"N": str(value)}
+        else:
+            serialized[name] = _serializer.serialize(value)
+    return serialized
+
+
+def deserialize_shipping(item: dict):
+    deserialized = {}
+    for name, value in item.items():
+        if "S" in value:
+            deserialized[name] = value["S"]
+        elif "N" in value:
+            deserialized[name] = Decimal(value["N"])
+        else:
+            deserialized[name] = _deserializer.deserialize(value)
+    return deserialized
+
+
+class ClientShippingRepository(ShippingRepository):
+    """
+    ShippingRepository on the low-level DynamoDB client. The hot operations skip
+    the resource layer and its generic TypeSerializer/TypeDeserializer, and use
+    request templates and (de)serialization written for the shipping schema.
+    Everything else is inherited.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.raw_client = get_client("dynamodb")
+        self.table_name = self.table.name
+
+    def get_shipping(self, shipping_id, fields: list = None, consistent_read: bool = False):
+        response = self.raw_client.get_item(
+            TableName=self.table_name,
+            Key={"shipping_id": {"S": shipping_id}},
+            ConsistentRead=consistent_read,
+            **self._projection(fields)
+        )
+        item = response.get("Item")
+        return self._load_item(deserialize_shipping(item)) if item is not None else None
+
+    def get_shippings(self, shipping_ids, fields: list = None, max_attempts: int = 5):
+        keys = [{"shipping_id": {"S": shipping_id}} for shipping_id in dict.fromkeys(shipping_ids)]
+        return self._get_batch(self.raw_client, keys, lambda item: self._load_item(deserialize_shipping(item)),
+                               fields, max_attempts)
+
+    def create_shipping(self, shipping_type: str, product_ids: list, order_id: str, status: str, due_date,
+                        shipping_id: str = None):
+        item = self._build_shipping_item(shipping_type, product_ids, order_id, status, due_date, shipping_id)
+        condition = {"ConditionExpression": "attribute_not_exists(shipping_id)"} if shipping_id else {}
+        self.raw_client.put_item(TableName=self.table_name, Item=serialize_shipping(item), **condition)
+        return item["shipping_id"]
+
+    def put_shippings(self, items: list, max_attempts: int = 5):
+        batch_write_items(self.raw_client, self.table_name,
+                          [{"PutRequest": {"Item": serialize_shipping(item)}} for item in items],
+                          self.BATCH_WRITE_SIZE, max_attempts)
+
+    def put_shippings_with_outbox(self, items: list):
+        transaction = [
+            {"Put": dict(action["Put"], Item=serialize_shipping(action["Put"]["Item"]))}
+            for action in self._outbox_transaction(items)
+        ]
+        self.raw_client.transact_write_items(TransactItems=transaction)
+
+    def update_shipping_status(self, shipping_id, status):
+        return self.raw_client.update_item(
+            TableName=self.table_name,
+            Key={"shipping_id": {"S": shipping_id}},
+            UpdateExpression="SET shipping_status = :sh_status",
+            ExpressionAttributeValues={":sh_status": {"S": status}}
+        )
+
+    def update_shipping_statuses(self, statuses: dict):
+        updates = list(statuses.items())
+        for start in range(0, len(updates), self.STATUS_TRANSACTION_SIZE):
+            self.raw_client.transact_write_items(TransactItems=[
+                {"Update": {
+                    "TableName": self.table_name,
+                    "Key": {"shipping_id": {"S": shipping_id}},
+                    "UpdateExpression": "SET shipping_status = :sh_status",
+                    "ExpressionAttributeValues": {":sh_status": {"S": status}}
+                }}
+                for shipping_id, status in updates[start:start + self.STATUS_TRANSACTION_SIZE]
+            ])
+
+    def update_shipping_status_if(self, shipping_id, status, expected_status):
+        try:
+            self.raw_client.update_item(
+                TableName=self.table_name,
+                Key={"shipping_id": {"S": shipping_id}},
+                UpdateExpression="SET shipping_status = :sh_status",
+                ConditionExpression="shipping_status = :expected_status",
+                ExpressionAttributeValues={":sh_status": {"S": status}, ":expected_status": {"S": expected_status}}
+            )
+        except self.raw_client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
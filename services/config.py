@@ -2,5 +2,41 @@ import os
 
 AWS_ENDPOINT_URL = os.getenv("AWS_ENDPOINT_URL", "http://localhost:4566")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+# botocore client settings shared by every DynamoDB and SQS client, see services.db
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+AWS_TCP_KEEPALIVE = os.getenv("AWS_TCP_KEEPALIVE", "true").lower() == "true"
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "adaptive")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "5"))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "2"))
+# must stay above the 10 second long poll of ShippingPublisher
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "20"))
+# "aws" (DynamoDB and SQS), "memory" (in process, for benchmarks and tests) or "sqlite"
+# (SQLite database and an in-process queue, for single node deployments), see services.backends
+SHIPPING_BACKEND = os.getenv("SHIPPING_BACKEND", "aws")
+SHIPPING_SQLITE_PATH = os.getenv("SHIPPING_SQLITE_PATH", "shipping.db")
 SHIPPING_TABLE_NAME = os.getenv("SHIPPING_TABLE_NAME", "ShippingTable")
+# how due_date/created_date are written: "iso" strings or "epoch" numbers, both are read
+SHIPPING_DATE_FORMAT = os.getenv("SHIPPING_DATE_FORMAT", "iso")
+SHIPPING_OUTBOX_TABLE_NAME = os.getenv("SHIPPING_OUTBOX_TABLE_NAME", "ShippingOutboxTable")
+# product_id -> shipping_id rows, answers "which shippings contain a product" without a scan
+SHIPPING_PRODUCT_TABLE_NAME = os.getenv("SHIPPING_PRODUCT_TABLE_NAME", "ShippingProductTable")
+# orders with more products store product_ids packed instead of as a list
+SHIPPING_PRODUCT_IDS_PACK_THRESHOLD = int(os.getenv("SHIPPING_PRODUCT_IDS_PACK_THRESHOLD", "256"))
 SHIPPING_QUEUE = os.getenv("SHIPPING_QUEUE_NAME", "ShippingQueue")
+# create the queue when it does not exist instead of failing, needs sqs:CreateQueue
+SHIPPING_QUEUE_AUTO_CREATE = os.getenv("SHIPPING_QUEUE_AUTO_CREATE", "false").lower() == "true"
+# seconds a received shipping message stays invisible, in-flight messages are extended by this much
+SHIPPING_VISIBILITY_TIMEOUT = int(os.getenv("SHIPPING_VISIBILITY_TIMEOUT", "30"))
+# read-through cache of CachedShippingRepository
+SHIPPING_CACHE_SIZE = int(os.getenv("SHIPPING_CACHE_SIZE", "10000"))
+SHIPPING_CACHE_TTL = float(os.getenv("SHIPPING_CACHE_TTL", "5"))
+# missing shippings remembered by SingleFlightShippingRepository, kept short: they may be written any moment
+SHIPPING_NEGATIVE_CACHE_SIZE = int(os.getenv("SHIPPING_NEGATIVE_CACHE_SIZE", "10000"))
+SHIPPING_NEGATIVE_CACHE_TTL = float(os.getenv("SHIPPING_NEGATIVE_CACHE_TTL", "1"))
+# buffer status updates and write only the last one per shipping, see services.write_behind
+SHIPPING_WRITE_BEHIND = os.getenv("SHIPPING_WRITE_BEHIND", "false").lower() == "true"
+# seconds a status update may wait before it is written
+SHIPPING_WRITE_BEHIND_WINDOW = float(os.getenv("SHIPPING_WRITE_BEHIND_WINDOW", "0.05"))
+# "parallel" update_item calls or "transaction" (TransactWriteItems of up to 100 shippings: fewer
+# requests, but transactional writes cost twice the write capacity)
+SHIPPING_WRITE_BEHIND_FLUSH_MODE = os.getenv("SHIPPING_WRITE_BEHIND_FLUSH_MODE", "parallel")
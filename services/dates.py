@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from .config import SHIPPING_DATE_FORMAT
+
+DATE_FORMAT_ISO = "iso"
+DATE_FORMAT_EPOCH = "epoch"
+
+
+def encode_date(value: datetime, date_format: str = None):
+    """
+    Stored form of a shipping date: an ISO 8601 string, or epoch seconds with
+    millisecond precision as a DynamoDB number.
+    """
+    value = value.replace(tzinfo=timezone.utc)
+    if (date_format or SHIPPING_DATE_FORMAT) == DATE_FORMAT_EPOCH:
+        return Decimal(round(value.timestamp() * 1000)).scaleb(-3)
+    return value.isoformat()
+
+
+def decode_date(value):
+    """Reads both stored forms, items written before the epoch format keep working."""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return datetime.fromtimestamp(float(value), timezone.utc)
@@ -1,9 +1,87 @@
+import threading
+
 import boto3
-from .config import AWS_ENDPOINT_URL, AWS_REGION
+from botocore.config import Config
 
-def get_dynamodb_resource():
-    return boto3.resource(
-        "dynamodb",
-        endpoint_url=AWS_ENDPOINT_URL,
-        region_name=AWS_REGION
+from .config import (
+    AWS_ENDPOINT_URL, AWS_REGION, AWS_MAX_POOL_CONNECTIONS, AWS_TCP_KEEPALIVE, AWS_RETRY_MODE,
+    AWS_MAX_ATTEMPTS, AWS_CONNECT_TIMEOUT, AWS_READ_TIMEOUT
+)
+
+# Process wide registry: clients are thread safe and shared by every thread, resources are
+# not, so every thread gets its own. Building either costs tens of milliseconds and a new
+# connection pool, so they are created once and reused by repositories and publishers.
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_thread_resources = threading.local()
+
+
+def get_client_config():
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=AWS_TCP_KEEPALIVE,
+        retries={"mode": AWS_RETRY_MODE, "max_attempts": AWS_MAX_ATTEMPTS},
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
     )
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        session = boto3.session.Session(region_name=AWS_REGION)
+        if session.get_credentials() is None:
+            # LocalStack accepts any credentials
+            session = boto3.session.Session(
+                region_name=AWS_REGION, aws_access_key_id="test", aws_secret_access_key="test"
+            )
+        _session = session
+    return _session
+
+
+def get_client(service_name: str):
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = _get_session().client(
+                    service_name,
+                    endpoint_url=AWS_ENDPOINT_URL,
+                    region_name=AWS_REGION,
+                    config=get_client_config()
+                )
+                _clients[service_name] = client
+    return client
+
+
+def get_resource(service_name: str):
+    resources = getattr(_thread_resources, "resources", None)
+    if resources is None:
+        resources = _thread_resources.resources = {}
+    resource = resources.get(service_name)
+    if resource is None:
+        # sessions are not thread safe either, creating from the shared one is serialized
+        with _lock:
+            resource = _get_session().resource(
+                service_name,
+                endpoint_url=AWS_ENDPOINT_URL,
+                region_name=AWS_REGION,
+                config=get_client_config()
+            )
+        resources[service_name] = resource
+    return resource
+
+
+def get_dynamodb_resource():
+    return get_resource("dynamodb")
+
+
+def reset_clients():
+    """Drops the cached session and clients, e.g. after configuration changed in tests or after a fork."""
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
+        _thread_resources.__dict__.clear()
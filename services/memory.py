@@ -0,0 +1,305 @@
+import bisect
+import heapq
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+from .config import SHIPPING_TABLE_NAME, SHIPPING_QUEUE, SHIPPING_VISIBILITY_TIMEOUT
+from .product_ids import decode_product_ids
+from .publisher import ShippingPublisher, ShippingMessage
+from .repository import ShippingRepository
+
+
+_OK = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+
+def _client_error(code, operation):
+    # same error as DynamoDB returns, callers handle both backends alike
+    return ClientError({"Error": {"Code": code, "Message": "The conditional request failed"}}, operation)
+
+
+class MemoryShippingStore:
+    """Shippings, outbox and product index of one table name, shared by every repository in the process."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.shippings = {}
+        self.outbox = {}
+        self.products = {}
+
+
+_stores = {}
+_queues = {}
+_registry_lock = threading.Lock()
+
+
+def _store(table_name):
+    with _registry_lock:
+        return _stores.setdefault(table_name, MemoryShippingStore())
+
+
+def _queue(queue_name):
+    with _registry_lock:
+        return _queues.setdefault(queue_name, MemoryQueue())
+
+
+def reset_memory_backend():
+    """Drops every in-memory table and queue."""
+    with _registry_lock:
+        _stores.clear()
+        _queues.clear()
+
+
+class MemoryShippingRepository(ShippingRepository):
+    """
+    ShippingRepository on process memory. Writes keep the DynamoDB semantics the
+    service relies on (conditional puts, all or nothing outbox transactions, upserting
+    updates), reads return the item types boto3 returns (numbers as Decimal).
+    """
+
+    def __init__(self, table_name: str = SHIPPING_TABLE_NAME):
+        self.table_name = table_name
+        self.store = _store(table_name)
+
+    def get_shipping(self, shipping_id, fields: list = None, consistent_read: bool = False):
+        with self.store.lock:
+            item = self.store.shippings.get(shipping_id)
+            return self._load_item(self._copy(item, fields)) if item is not None else None
+
+    def get_shippings(self, shipping_ids, fields: list = None, max_attempts: int = 5):
+        if fields:
+            fields = ["shipping_id"] + [field for field in fields if field != "shipping_id"]
+        items = {}
+        with self.store.lock:
+            for shipping_id in shipping_ids:
+                item = self.store.shippings.get(shipping_id)
+                if item is not None:
+                    items[shipping_id] = self._load_item(self._copy(item, fields))
+        return items
+
+    def create_shipping(self, shipping_type: str, product_ids: list, order_id: str, status: str, due_date: datetime,
+                        shipping_id: str = None):
+        item = self._build_shipping_item(shipping_type, product_ids, order_id, status, due_date, shipping_id)
+        with self.store.lock:
+            if shipping_id is not None and shipping_id in self.store.shippings:
+                raise _client_error("ConditionalCheckFailedException", "PutItem")
+            self._put(item)
+        return item["shipping_id"]
+
+    def put_shippings(self, items: list):
+        with self.store.lock:
+            for item in items:
+                self._put(item)
+
+    def put_shippings_with_outbox(self, items: list):
+        with self.store.lock:
+            if any(item["shipping_id"] in self.store.shippings for item in items):
+                raise _client_error("TransactionCanceledException", "TransactWriteItems")
+            for item in items:
+                self._put(item)
+                self.store.outbox[item["shipping_id"]] = {
+                    "shipping_id": item["shipping_id"], "created_date": item["created_date"]
+                }
+
+    def index_products(self, items: list, max_attempts: int = 5):
+        with self.store.lock:
+            for item in items:
+                for product_id in decode_product_ids(item["product_ids"]):
+                    self.store.products.setdefault(product_id, set()).add(item["shipping_id"])
+
+    def iter_shipping_ids_by_product(self, product_id: str, page_size: int = 100):
+        with self.store.lock:
+            shipping_ids = sorted(self.store.products.get(product_id, ()))
+        yield from shipping_ids
+
+    def get_outbox(self, limit: int = 100, start_key: dict = None):
+        with self.store.lock:
+            page, last_key = self._page(sorted(self.store.outbox), limit, start_key)
+            return [dict(self.store.outbox[shipping_id]) for shipping_id in page], last_key
+
+    def delete_outbox(self, shipping_ids: list):
+        with self.store.lock:
+            for shipping_id in shipping_ids:
+                self.store.outbox.pop(shipping_id, None)
+
+    def update_shipping_status(self, shipping_id, status):
+        with self.store.lock:
+            # update_item creates a missing item, like DynamoDB
+            self.store.shippings.setdefault(shipping_id, {"shipping_id": shipping_id})["shipping_status"] = status
+        return _OK
+
+    def update_shipping_statuses(self, statuses: dict):
+        with self.store.lock:
+            for shipping_id, status in statuses.items():
+                self.update_shipping_status(shipping_id, status)
+
+    def update_shipping_status_if(self, shipping_id, status, expected_status):
+        with self.store.lock:
+            item = self.store.shippings.get(shipping_id)
+            if item is None or item.get("shipping_status") != expected_status:
+                return False
+            item["shipping_status"] = status
+        return True
+
+    def iter_overdue(self, now: datetime, status: str, page_size: int = 100):
+        now_epoch = math.floor(now.timestamp())
+        with self.store.lock:
+            overdue = sorted(
+                ({"shipping_id": item["shipping_id"], "shipping_status": status, "due_epoch": item["due_epoch"]}
+                 for item in self.store.shippings.values()
+                 if item.get("shipping_status") == status and "due_epoch" in item and item["due_epoch"] < now_epoch),
+                key=lambda item: item["due_epoch"]
+            )
+        yield from overdue
+
+    def get_order_page(self, order_id, limit: int = 100, start_key: dict = None):
+        order_id = str(order_id)
+        with self.store.lock:
+            shipping_ids = sorted(
+                shipping_id for shipping_id, item in self.store.shippings.items() if item.get("order_id") == order_id
+            )
+        page, last_key = self._page(shipping_ids, limit, start_key)
+        return [{"shipping_id": shipping_id, "order_id": order_id} for shipping_id in page], last_key
+
+    def _put(self, item):
+        stored = dict(item)
+        if "due_epoch" in stored:
+            stored["due_epoch"] = Decimal(stored["due_epoch"])
+        self.store.shippings[item["shipping_id"]] = stored
+
+    @staticmethod
+    def _copy(item, fields):
+        if fields:
+            return {field: item[field] for field in fields if field in item}
+        return dict(item)
+
+    @staticmethod
+    def _page(keys, limit, start_key):
+        start = bisect.bisect_right(keys, start_key["shipping_id"]) if start_key else 0
+        page = keys[start:start + limit]
+        last_key = {"shipping_id": page[-1]} if start + limit < len(keys) else None
+        return page, last_key
+
+
+class MemoryQueue:
+    """A standard SQS queue in memory: at least once delivery, receipt handles and visibility timeouts."""
+
+    def __init__(self, visibility_timeout: int = SHIPPING_VISIBILITY_TIMEOUT, clock=time.monotonic):
+        self.visibility_timeout = visibility_timeout
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.ready = deque()
+        # message id -> message, received messages are also keyed by their current receipt handle
+        self.messages = {}
+        self.in_flight = {}
+        # (visible again at, receipt handle), stale entries are skipped
+        self.timeouts = []
+
+    def send(self, body):
+        message = {"id": str(uuid4()), "body": body, "sent_timestamp": time.time()}
+        with self.condition:
+            self.messages[message["id"]] = message
+            self.ready.append(message)
+            self.condition.notify()
+        return message["id"]
+
+    def receive(self, max_messages, wait_time):
+        deadline = self.clock() + wait_time
+        with self.condition:
+            while True:
+                self._expire()
+                if self.ready:
+                    break
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return []
+                next_timeout = self.timeouts[0][0] - self.clock() if self.timeouts else remaining
+                self.condition.wait(max(0, min(remaining, next_timeout)))
+            received = []
+            while self.ready and len(received) < max_messages:
+                message = self.ready.popleft()
+                if message["id"] not in self.messages:
+                    continue
+                receipt_handle = f'{message["id"]}#{uuid4()}'
+                message["receipt_handle"] = receipt_handle
+                message["visible_at"] = self.clock() + self.visibility_timeout
+                self.in_flight[receipt_handle] = message
+                heapq.heappush(self.timeouts, (message["visible_at"], receipt_handle))
+                received.append(dict(message))
+            return received
+
+    def delete(self, receipt_handle):
+        with self.condition:
+            message = self.in_flight.pop(receipt_handle, None)
+            if message is None:
+                # like SQS, deleting with an old handle of a redelivered message still deletes it
+                message_id = receipt_handle.split("#")[0]
+                message = self.messages.get(message_id)
+                if message is None:
+                    return False
+                self.in_flight.pop(message.get("receipt_handle"), None)
+            self.messages.pop(message["id"], None)
+        return True
+
+    def change_visibility(self, receipt_handle, timeout):
+        with self.condition:
+            message = self.in_flight.get(receipt_handle)
+            if message is None:
+                return False
+            message["visible_at"] = self.clock() + timeout
+            heapq.heappush(self.timeouts, (message["visible_at"], receipt_handle))
+            self._expire()
+            self.condition.notify_all()
+        return True
+
+    def _expire(self):
+        now = self.clock()
+        while self.timeouts and self.timeouts[0][0] <= now:
+            visible_at, receipt_handle = heapq.heappop(self.timeouts)
+            message = self.in_flight.get(receipt_handle)
+            if message is None or message["visible_at"] != visible_at:
+                continue
+            del self.in_flight[receipt_handle]
+            self.ready.append(message)
+
+
+class MemoryShippingPublisher(ShippingPublisher):
+    """ShippingPublisher on a MemoryQueue, publishers of the same queue name share it."""
+
+    def __init__(self, queue_name: str = SHIPPING_QUEUE, auto_create: bool = True, wait_time: float = 1.0):
+        self.queue_name = queue_name
+        self.auto_create = auto_create
+        # receive waits at most this long for a message, SQS long polls for 10 seconds
+        self.wait_time = wait_time
+        self.queue = _queue(queue_name)
+
+    @property
+    def queue_url(self):
+        return f"memory://{self.queue_name}"
+
+    def send_new_shipping(self, shipping_id: str):
+        return self.queue.send(shipping_id)
+
+    def send_new_shippings(self, shipping_ids: list, max_attempts: int = 3):
+        return {shipping_id: self.queue.send(shipping_id) for shipping_id in shipping_ids}
+
+    def poll_shipping_messages(self, batch_size: int = 10):
+        return [
+            ShippingMessage(message["body"], message["receipt_handle"], message["sent_timestamp"])
+            for message in self.queue.receive(batch_size, self.wait_time)
+        ]
+
+    def acknowledge_shippings(self, receipt_handles: list):
+        return [receipt_handle for receipt_handle in receipt_handles if not self.queue.delete(receipt_handle)]
+
+    def change_visibility(self, receipt_handles: list, timeout: int):
+        return [
+            receipt_handle for receipt_handle in receipt_handles
+            if not self.queue.change_visibility(receipt_handle, timeout)
+        ]
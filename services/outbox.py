@@ -0,0 +1,92 @@
+import argparse
+import logging
+import signal
+import threading
+
+from .backends import create_repository, create_publisher
+
+
+logger = logging.getLogger(__name__)
+
+
+class ShippingOutboxRelay:
+    """
+    Drains the shipping outbox table into the shipping queue in the background, and
+    writes the product index rows of the shippings before publishing them.
+    """
+
+    INDEX_FIELDS: list = ["shipping_id", "product_ids"]
+
+    def __init__(self, repository, publisher, batch_size: int = 100, interval: float = 1.0):
+        self.repository = repository
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+        # the scan continues where the previous page stopped, so records that keep
+        # failing do not hold back the ones behind them
+        self._cursor = None
+
+    def drain_once(self):
+        records, self._cursor = self.repository.get_outbox(self.batch_size, self._cursor)
+        if not records:
+            return 0
+
+        # reads are eventually consistent, a shipping that is not read yet waits for the next cycle
+        shippings = self.repository.get_shippings([record["shipping_id"] for record in records],
+                                                  fields=self.INDEX_FIELDS)
+        if shippings:
+            self.repository.index_products(list(shippings.values()))
+        sent = self.publisher.send_new_shippings([record["shipping_id"] for record in records
+                                                  if record["shipping_id"] in shippings])
+        # records that were not sent stay in the outbox and are retried on the next cycle
+        self.repository.delete_outbox(list(sent))
+
+        return len(sent)
+
+    def drain(self):
+        """Makes one pass over the outbox."""
+        total = self.drain_once()
+        while self._cursor is not None:
+            total += self.drain_once()
+        return total
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="shipping-outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Shipping outbox relay cycle failed")
+            self._stopped.wait(self.interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish shippings from the shipping outbox")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s %(message)s")
+    relay = ShippingOutboxRelay(create_repository(), create_publisher(), args.batch_size, args.interval)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    relay.start()
+    stopped.wait()
+    relay.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from collections.abc import Sequence
+import json
+import zlib
+
+from .config import SHIPPING_PRODUCT_IDS_PACK_THRESHOLD
+
+
+def encode_product_ids(product_ids: list, pack_threshold: int = None):
+    """
+    Stored form of the product ids: a DynamoDB list, or zlib packed JSON (binary)
+    for orders with more than pack_threshold products.
+    """
+    product_ids = [str(product_id) for product_id in product_ids]
+    if len(product_ids) > (pack_threshold or SHIPPING_PRODUCT_IDS_PACK_THRESHOLD):
+        return zlib.compress(json.dumps(product_ids, ensure_ascii=False, separators=(",", ":")).encode())
+    return product_ids
+
+
+def decode_product_ids(value):
+    """Reads every stored form, including the comma joined string of older items."""
+    if isinstance(value, str):
+        return value.split(",") if value else []
+    if isinstance(value, ProductIds):
+        return list(value.decoded)
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    # boto3 returns binary attributes as Binary, the raw bytes are in .value
+    return json.loads(zlib.decompress(getattr(value, "value", value)))
+
+
+class ProductIds(Sequence):
+    """Product ids of a read shipping, decoded on first access."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._decoded = None
+
+    @property
+    def decoded(self):
+        if self._decoded is None:
+            self._decoded = decode_product_ids(self.raw)
+        return self._decoded
+
+    def __getitem__(self, index):
+        return self.decoded[index]
+
+    def __len__(self):
+        return len(self.decoded)
+
+    def __eq__(self, other):
+        if isinstance(other, ProductIds):
+            other = other.decoded
+        return isinstance(other, list) and self.decoded == other
+
+    def __repr__(self):
+        return f"ProductIds({self.decoded!r})"
@@ -1,19 +1,68 @@
-import boto3
+import logging
+import threading
+from dataclasses import dataclass
 
-from .config import AWS_ENDPOINT_URL, AWS_REGION, SHIPPING_QUEUE
+from .config import AWS_REGION, SHIPPING_QUEUE, SHIPPING_QUEUE_AUTO_CREATE, SHIPPING_VISIBILITY_TIMEOUT
+from .db import get_client
+
+
+logger = logging.getLogger(__name__)
+
+# (queue name, region) -> queue url, resolved once per process
+_queue_urls = {}
+_queue_urls_lock = threading.Lock()
+
+
+def resolve_queue_url(client, queue_name: str, auto_create: bool = False):
+    key = (queue_name, AWS_REGION)
+    queue_url = _queue_urls.get(key)
+    if queue_url is not None:
+        return queue_url
+
+    with _queue_urls_lock:
+        queue_url = _queue_urls.get(key)
+        if queue_url is None:
+            try:
+                queue_url = client.get_queue_url(QueueName=queue_name)["QueueUrl"]
+            except client.exceptions.QueueDoesNotExist:
+                if not auto_create:
+                    raise
+                queue_url = client.create_queue(QueueName=queue_name)["QueueUrl"]
+            _queue_urls[key] = queue_url
+
+    return queue_url
+
+
+def clear_queue_urls():
+    with _queue_urls_lock:
+        _queue_urls.clear()
+
+
+@dataclass
+class ShippingMessage:
+    shipping_id: str
+    receipt_handle: str
+    # epoch seconds at which SQS accepted the message
+    sent_timestamp: float = None
 
 
 class ShippingPublisher:
-    def __init__(self):
-        self.client = boto3.client(
-            "sqs",
-            endpoint_url=AWS_ENDPOINT_URL,
-            region_name=AWS_REGION,
-            aws_access_key_id="test",
-            aws_secret_access_key="test",
-        )
-        response = self.client.create_queue(QueueName=SHIPPING_QUEUE)
-        self.queue_url = response["QueueUrl"]
+    SEND_BATCH_SIZE: int = 10
+    DELETE_BATCH_SIZE: int = 10
+    VISIBILITY_BATCH_SIZE: int = 10
+
+    def __init__(self, queue_name: str = SHIPPING_QUEUE, auto_create: bool = SHIPPING_QUEUE_AUTO_CREATE):
+        self.client = get_client("sqs")
+        self.queue_name = queue_name
+        self.auto_create = auto_create
+        self._queue_url = None
+
+    @property
+    def queue_url(self):
+        # resolved on first use, constructing a publisher makes no request
+        if self._queue_url is None:
+            self._queue_url = resolve_queue_url(self.client, self.queue_name, self.auto_create)
+        return self._queue_url
 
     def send_new_shipping(self, shipping_id: str):
         response = self.client.send_message(
@@ -23,9 +72,42 @@ class ShippingPublisher:
 
         return response['MessageId']
 
+    def send_new_shippings(self, shipping_ids: list, max_attempts: int = 3):
+        """Returns {shipping_id: message_id} for every shipping that was sent."""
+        sent = {}
+        pending = list(shipping_ids)
+        for _ in range(max_attempts):
+            if not pending:
+                break
+            failed = []
+            for start in range(0, len(pending), self.SEND_BATCH_SIZE):
+                chunk = pending[start:start + self.SEND_BATCH_SIZE]
+                response = self.client.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {'Id': str(index), 'MessageBody': shipping_id}
+                        for index, shipping_id in enumerate(chunk)
+                    ]
+                )
+                for entry in response.get('Successful', []):
+                    sent[chunk[int(entry['Id'])]] = entry['MessageId']
+                for entry in response.get('Failed', []):
+                    if entry.get('SenderFault'):
+                        # retrying will not help, the caller sees the shipping missing from the result
+                        logger.warning("Shipping %s was rejected: %s", chunk[int(entry['Id'])], entry.get('Message'))
+                    else:
+                        failed.append(chunk[int(entry['Id'])])
+            pending = failed
+
+        return sent
+
     def poll_shipping(self, batch_size: int = 10):
+        return [message.shipping_id for message in self.poll_shipping_messages(batch_size)]
+
+    def poll_shipping_messages(self, batch_size: int = 10):
         messages = self.client.receive_message(
             QueueUrl=self.queue_url,
+            AttributeNames=['SentTimestamp'],
             MessageAttributeNames=['All'],
             MaxNumberOfMessages=batch_size,
             WaitTimeSeconds=10
@@ -34,4 +116,102 @@ class ShippingPublisher:
         if 'Messages' not in messages:
             return []
 
-        return [msg['Body'] for msg in messages['Messages']]
+        return [
+            ShippingMessage(msg['Body'], msg['ReceiptHandle'], int(msg['Attributes']['SentTimestamp']) / 1000)
+            if 'SentTimestamp' in msg.get('Attributes', {})
+            else ShippingMessage(msg['Body'], msg['ReceiptHandle'])
+            for msg in messages['Messages']
+        ]
+
+    def acknowledge_shippings(self, receipt_handles: list):
+        """Deletes processed messages, returns the receipt handles that could not be deleted."""
+        failed = []
+        for start in range(0, len(receipt_handles), self.DELETE_BATCH_SIZE):
+            chunk = receipt_handles[start:start + self.DELETE_BATCH_SIZE]
+            response = self.client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {'Id': str(index), 'ReceiptHandle': receipt_handle}
+                    for index, receipt_handle in enumerate(chunk)
+                ]
+            )
+            failed.extend(chunk[int(entry['Id'])] for entry in response.get('Failed', []))
+
+        return failed
+
+    def change_visibility(self, receipt_handles: list, timeout: int):
+        """Sets the visibility timeout of received messages, returns the receipt handles that failed."""
+        failed = []
+        for start in range(0, len(receipt_handles), self.VISIBILITY_BATCH_SIZE):
+            chunk = receipt_handles[start:start + self.VISIBILITY_BATCH_SIZE]
+            response = self.client.change_message_visibility_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {'Id': str(index), 'ReceiptHandle': receipt_handle, 'VisibilityTimeout': timeout}
+                    for index, receipt_handle in enumerate(chunk)
+                ]
+            )
+            failed.extend(chunk[int(entry['Id'])] for entry in response.get('Failed', []))
+
+        return failed
+
+    def release_shippings(self, receipt_handles: list):
+        """Makes messages visible again right away so that a failed shipping is retried promptly."""
+        return self.change_visibility(receipt_handles, 0)
+
+
+class VisibilityHeartbeat:
+    """
+    Keeps tracked messages invisible while they are in flight by extending their
+    visibility timeout every third of it.
+    """
+
+    def __init__(self, publisher: ShippingPublisher, visibility_timeout: int = SHIPPING_VISIBILITY_TIMEOUT):
+        self.publisher = publisher
+        self.visibility_timeout = visibility_timeout
+        self._receipt_handles = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def track(self, receipt_handles):
+        with self._lock:
+            self._receipt_handles.update(receipt_handles)
+
+    def untrack(self, receipt_handles):
+        with self._lock:
+            self._receipt_handles.difference_update(receipt_handles)
+
+    def extend(self):
+        with self._lock:
+            receipt_handles = list(self._receipt_handles)
+        if not receipt_handles:
+            return
+        failed = self.publisher.change_visibility(receipt_handles, self.visibility_timeout)
+        if failed:
+            # the handle expired or the message was deleted meanwhile, nothing left to extend
+            logger.warning("Could not extend visibility of %d shippings", len(failed))
+            self.untrack(failed)
+
+    def start(self):
+        """Starts the heartbeat thread unless it is running."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="shipping-heartbeat", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.visibility_timeout / 3):
+            try:
+                self.extend()
+            except Exception:
+                logger.exception("Extending shipping visibility failed")
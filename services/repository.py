@@ -1,38 +1,195 @@
-from .config import SHIPPING_TABLE_NAME
+from .config import SHIPPING_TABLE_NAME, SHIPPING_OUTBOX_TABLE_NAME, SHIPPING_PRODUCT_TABLE_NAME
 from .db import get_dynamodb_resource
+from .tables import STATUS_DUE_INDEX, ORDER_INDEX
+from .dates import encode_date
+from .product_ids import encode_product_ids, decode_product_ids, ProductIds
 
 from uuid import uuid4
 from datetime import datetime, timezone
+import logging
+import math
+import time
 
 
-class ShippingRepository:
+logger = logging.getLogger(__name__)
+
+
+def batch_get_items(client, table_name: str, keys: list, decode, projection: dict = None, chunk_size: int = 100,
+                    max_attempts: int = 5):
+    """
+    Reads `keys` (in the client's key format) with BatchGetItem, chunk_size keys per
+    call, and returns the decoded items. Unprocessed keys are retried with backoff,
+    the ones left after max_attempts are logged and left out like missing items.
+    """
+    items = []
+    for start in range(0, len(keys), chunk_size):
+        request = {table_name: {"Keys": keys[start:start + chunk_size], **(projection or {})}}
+        for attempt in range(max_attempts):
+            response = client.batch_get_item(RequestItems=request)
+            items.extend(decode(item) for item in response["Responses"].get(table_name, []))
+            request = response.get("UnprocessedKeys")
+            if not request:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            logger.warning("Could not read %d items of %s", len(request[table_name]["Keys"]), table_name)
+    return items
+
+
+def batch_write_items(client, table_name: str, requests: list, chunk_size: int = 25, max_attempts: int = 5):
+    """
+    Sends write `requests` (in the client's item format) with BatchWriteItem, chunk_size
+    per call. Unprocessed items are retried with backoff, RuntimeError is raised for
+    the ones left after max_attempts.
+    """
+    for start in range(0, len(requests), chunk_size):
+        request = {table_name: requests[start:start + chunk_size]}
+        for attempt in range(max_attempts):
+            request = client.batch_write_item(RequestItems=request).get("UnprocessedItems")
+            if not request:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise RuntimeError(f"Could not write {len(request[table_name])} items of {table_name}")
 
 
+class ShippingRepository:
+    # TransactWriteItems accepts up to 100 actions, every shipping takes two
+    OUTBOX_TRANSACTION_SIZE: int = 50
+    # BatchGetItem accepts up to 100 keys
+    BATCH_GET_SIZE: int = 100
+    # BatchWriteItem accepts up to 25 items
+    BATCH_WRITE_SIZE: int = 25
+    # TransactWriteItems accepts up to 100 actions
+    STATUS_TRANSACTION_SIZE: int = 100
+
     def __init__(self):
         dynamo_resource = get_dynamodb_resource()
         self.table = dynamo_resource.Table(SHIPPING_TABLE_NAME)
+        self.outbox_table = dynamo_resource.Table(SHIPPING_OUTBOX_TABLE_NAME)
+        self.product_table = dynamo_resource.Table(SHIPPING_PRODUCT_TABLE_NAME)
+        # resources are not thread safe, calls made from worker threads go through the client,
+        # which still accepts and returns plain python values
+        self.client = self.table.meta.client
 
 
-    def get_shipping(self, shipping_id):
-        response = self.table.get_item(Key={"shipping_id": shipping_id})
-        return response.get("Item")
+    def get_shipping(self, shipping_id, fields: list = None, consistent_read: bool = False):
+        """
+        Reads only `fields` when they are given. Reads are eventually consistent
+        (half the read capacity) unless consistent_read is set.
+        """
+        response = self.client.get_item(
+            TableName=self.table.name,
+            Key={"shipping_id": shipping_id},
+            ConsistentRead=consistent_read,
+            **self._projection(fields)
+        )
+        return self._load_item(response.get("Item"))
 
-    def create_shipping(self, shipping_type: str, product_ids: list, order_id: str, status: str, due_date: datetime):
-        shipping_id = str(uuid4())
-        item = {
-            "shipping_id": shipping_id,
-            "shipping_type": shipping_type,
-            "order_id": order_id,
-            "product_ids": ",".join(product_ids),
-            "shipping_status": status,
-            "created_date": datetime.now(timezone.utc).isoformat(),
-            "due_date": due_date.replace(tzinfo=timezone.utc).isoformat()
+    def get_shippings(self, shipping_ids, fields: list = None, max_attempts: int = 5):
+        """
+        Returns {shipping_id: item} for the shippings that were read. Keys that are
+        still unprocessed after max_attempts are left out like missing shippings.
+        """
+        keys = [{"shipping_id": shipping_id} for shipping_id in dict.fromkeys(shipping_ids)]
+        return self._get_batch(self.client, keys, self._load_item, fields, max_attempts)
+
+    def _get_batch(self, client, keys, decode, fields, max_attempts):
+        # items are returned keyed by their id, so it is always part of the projection
+        projection = self._projection(["shipping_id"] + [field for field in fields if field != "shipping_id"]) \
+            if fields else {}
+        items = batch_get_items(client, self.table.name, keys, decode, projection, self.BATCH_GET_SIZE, max_attempts)
+        return {item["shipping_id"]: item for item in items}
+
+    @staticmethod
+    def new_shipping_id():
+        return str(uuid4())
+
+    def create_shipping(self, shipping_type: str, product_ids: list, order_id: str, status: str, due_date: datetime,
+                        shipping_id: str = None):
+        if shipping_id is None:
+            item = self._build_shipping_item(shipping_type, product_ids, order_id, status, due_date)
+            self.table.put_item(Item=item)
+        else:
+            # the id is already known to consumers, never overwrite an existing shipping with it
+            item = self._build_shipping_item(shipping_type, product_ids, order_id, status, due_date, shipping_id)
+            self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(shipping_id)')
+        return item["shipping_id"]
+
+    def create_shippings(self, shippings: list, status: str, shipping_ids: list = None):
+        items = self.build_shipping_items(shippings, status, shipping_ids)
+        self.put_shippings(items)
+        return items
+
+    def build_shipping_items(self, shippings: list, status: str, shipping_ids: list = None):
+        if shipping_ids is None:
+            shipping_ids = [self.new_shipping_id() for _ in shippings]
+        return [
+            self._build_shipping_item(shipping_type, product_ids, order_id, status, due_date, shipping_id)
+            for (shipping_type, product_ids, order_id, due_date), shipping_id in zip(shippings, shipping_ids)
+        ]
+
+    def put_shippings(self, items: list):
+        # batch_writer chunks into BatchWriteItem calls of 25 and re-queues UnprocessedItems
+        with self.table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+
+    def create_shipping_with_outbox(self, shipping_type: str, product_ids: list, order_id: str, status: str,
+                                    due_date: datetime):
+        item = self._build_shipping_item(shipping_type, product_ids, order_id, status, due_date)
+        self.put_shippings_with_outbox([item])
+        return item["shipping_id"]
+
+    def put_shippings_with_outbox(self, items: list):
+        """Writes up to OUTBOX_TRANSACTION_SIZE shippings and their outbox records in one transaction."""
+        self.client.transact_write_items(TransactItems=self._outbox_transaction(items))
+
+    def index_products(self, items: list, max_attempts: int = 5):
+        """
+        Writes the product index rows of the shipping items. Creating a shipping does not
+        write them, ShippingService and ShippingOutboxRelay write them after the shippings,
+        off the order request path, so the index lags the shippings like a GSI does.
+        """
+        rows = {
+            (product_id, item["shipping_id"]): {"product_id": product_id, "shipping_id": item["shipping_id"]}
+            for item in items for product_id in decode_product_ids(item["product_ids"])
         }
-        self.table.put_item(Item=item)
-        return shipping_id
+        batch_write_items(self.client, self.product_table.name, [{"PutRequest": {"Item": row}} for row in rows.values()],
+                          self.BATCH_WRITE_SIZE, max_attempts)
+
+    def iter_shipping_ids_by_product(self, product_id: str, page_size: int = 100):
+        """Yields the ids of the shippings that contain product_id, a page per query."""
+        params = {
+            "TableName": self.product_table.name,
+            "KeyConditionExpression": "product_id = :product_id",
+            "ExpressionAttributeValues": {":product_id": product_id},
+            "Limit": page_size,
+        }
+        while True:
+            response = self.client.query(**params)
+            for row in response.get("Items", []):
+                yield row["shipping_id"]
+            if "LastEvaluatedKey" not in response:
+                return
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def get_outbox(self, limit: int = 100, start_key: dict = None):
+        """Returns a page of outbox records and the key to continue the scan from (None at the end)."""
+        params = {"Limit": limit, "ConsistentRead": True}
+        if start_key:
+            params["ExclusiveStartKey"] = start_key
+        response = self.outbox_table.scan(**params)
+        return response.get("Items", []), response.get("LastEvaluatedKey")
+
+    def delete_outbox(self, shipping_ids: list):
+        with self.outbox_table.batch_writer() as batch:
+            for shipping_id in shipping_ids:
+                batch.delete_item(Key={"shipping_id": shipping_id})
 
     def update_shipping_status(self, shipping_id, status):
-        response = self.table.update_item(
+        response = self.client.update_item(
+            TableName=self.table.name,
             Key={
                 'shipping_id': shipping_id,
             },
@@ -43,3 +200,123 @@ class ShippingRepository:
         )
 
         return response
+
+    def update_shipping_statuses(self, statuses: dict):
+        """Sets {shipping_id: status} with a transaction per STATUS_TRANSACTION_SIZE shippings."""
+        updates = list(statuses.items())
+        for start in range(0, len(updates), self.STATUS_TRANSACTION_SIZE):
+            self.client.transact_write_items(TransactItems=[
+                {"Update": {
+                    "TableName": self.table.name,
+                    "Key": {"shipping_id": shipping_id},
+                    "UpdateExpression": "SET shipping_status = :sh_status",
+                    "ExpressionAttributeValues": {":sh_status": status}
+                }}
+                for shipping_id, status in updates[start:start + self.STATUS_TRANSACTION_SIZE]
+            ])
+
+    def update_shipping_status_if(self, shipping_id, status, expected_status):
+        """Sets the status only while it is still expected_status, returns whether it did."""
+        try:
+            self.client.update_item(
+                TableName=self.table.name,
+                Key={'shipping_id': shipping_id},
+                UpdateExpression='SET shipping_status = :sh_status',
+                ConditionExpression='shipping_status = :expected_status',
+                ExpressionAttributeValues={':sh_status': status, ':expected_status': expected_status}
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def iter_overdue(self, now: datetime, status: str, page_size: int = 100):
+        """
+        Yields {"shipping_id", "shipping_status", "due_epoch"} of the shippings in
+        `status` that were due before `now`, oldest first, a page per query.
+        """
+        params = {
+            "TableName": self.table.name,
+            "IndexName": STATUS_DUE_INDEX,
+            "KeyConditionExpression": "shipping_status = :sh_status AND due_epoch < :now",
+            "ExpressionAttributeValues": {":sh_status": status, ":now": math.floor(now.timestamp())},
+            "Limit": page_size,
+        }
+        while True:
+            response = self.client.query(**params)
+            yield from response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def get_order_page(self, order_id, limit: int = 100, start_key: dict = None):
+        """
+        Returns a page of {"shipping_id", "order_id"} of the order's shippings and the key
+        to continue from (None at the end). The index is eventually consistent, a shipping
+        written a moment ago may be missing.
+        """
+        params = {
+            "TableName": self.table.name,
+            "IndexName": ORDER_INDEX,
+            "KeyConditionExpression": "order_id = :order_id",
+            "ExpressionAttributeValues": {":order_id": str(order_id)},
+            "Limit": limit,
+        }
+        if start_key:
+            params["ExclusiveStartKey"] = start_key
+        response = self.client.query(**params)
+        return response.get("Items", []), response.get("LastEvaluatedKey")
+
+    def iter_by_order(self, order_id, page_size: int = 100):
+        """Yields {"shipping_id", "order_id"} of every shipping of the order, a page per query."""
+        start_key = None
+        while True:
+            items, start_key = self.get_order_page(order_id, page_size, start_key)
+            yield from items
+            if start_key is None:
+                return
+
+    @staticmethod
+    def _load_item(item):
+        # product_ids can be large and is rarely needed, it is decoded when first used
+        if item is not None and "product_ids" in item:
+            item["product_ids"] = ProductIds(item["product_ids"])
+        return item
+
+    @staticmethod
+    def _projection(fields):
+        if not fields:
+            return {}
+        # placeholders keep reserved words (e.g. "status") usable as field names
+        names = {f"#f{index}": field for index, field in enumerate(fields)}
+        return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+    def _outbox_transaction(self, items):
+        # the resource client serializes plain python values for transact_write_items as well
+        transaction = []
+        for item in items:
+            outbox_item = {"shipping_id": item["shipping_id"], "created_date": item["created_date"]}
+            transaction.append({"Put": {
+                "TableName": self.table.name,
+                "Item": item,
+                "ConditionExpression": "attribute_not_exists(shipping_id)"
+            }})
+            transaction.append({"Put": {
+                "TableName": self.outbox_table.name,
+                "Item": outbox_item
+            }})
+        return transaction
+
+    @classmethod
+    def _build_shipping_item(cls, shipping_type, product_ids, order_id, status, due_date, shipping_id=None):
+        return {
+            "shipping_id": shipping_id or cls.new_shipping_id(),
+            "shipping_type": shipping_type,
+            # key of ORDER_INDEX, which is typed as a string
+            "order_id": str(order_id),
+            "product_ids": encode_product_ids(product_ids),
+            "shipping_status": status,
+            "created_date": encode_date(datetime.now(timezone.utc)),
+            "due_date": encode_date(due_date),
+            # index key of STATUS_DUE_INDEX, rounded up so nothing is found overdue early
+            "due_epoch": math.ceil(due_date.replace(tzinfo=timezone.utc).timestamp())
+        }
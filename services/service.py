@@ -1,6 +1,17 @@
 from .repository import ShippingRepository
-from .publisher import ShippingPublisher
+from .publisher import ShippingPublisher, VisibilityHeartbeat
+from .dates import decode_date
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ShippingNotFoundError(LookupError):
+    pass
 
 
 class ShippingService:
@@ -9,49 +20,347 @@ class ShippingService:
     SHIPPING_COMPLETED: str = 'completed'
     SHIPPING_FAILED: str = 'failed'
 
-    def __init__(self, repository, publisher):
+    # put as 'created', publish, then update to 'in progress'
+    CREATE_MODE_TWO_PHASE: str = 'two phase'
+    # publish first, then a single conditional put of the 'in progress' shipping
+    CREATE_MODE_SINGLE_WRITE: str = 'single write'
+    # one transaction with the shipping and its outbox record, ShippingOutboxRelay publishes it
+    CREATE_MODE_OUTBOX: str = 'outbox'
+
+    # a message may arrive before its shipping is written (single write mode), it is retried
+    # until it is this old, after that the write is considered failed and the message is dropped
+    MISSING_SHIPPING_GRACE_SECONDS: int = 300
+
+    # attributes read on the hot paths, product_ids in particular can be large
+    PROCESS_FIELDS: list = ['shipping_id', 'due_date']
+    STATUS_FIELDS: list = ['shipping_status']
+
+    def __init__(self, repository, publisher, create_mode: str = CREATE_MODE_TWO_PHASE, max_workers: int = 10):
         self.repository = repository
         self.publisher = publisher
+        self.create_mode = create_mode
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shipping-service")
+        # product index writes running in the background
+        self._indexing = set()
+        # keeps the messages of process_shipping_batch invisible while they are processed
+        self.heartbeat = VisibilityHeartbeat(publisher)
+
+    def close(self):
+        self.heartbeat.stop()
+        # waits for the product index writes as well
+        self.executor.shutdown()
+        # write-behind and SQLite repositories write what is pending and release their connections
+        close = getattr(self.repository, "close", None)
+        if close is not None:
+            close()
+
+    def flush_statuses(self):
+        # a write-behind repository has to write the statuses before their messages are deleted
+        flush = getattr(self.repository, "flush", None)
+        if flush is not None:
+            flush()
 
     @staticmethod
     def list_available_shipping_type():
         return ['Нова Пошта', 'Укр Пошта', 'Meest Express', 'Самовивіз']
 
-    def create_shipping(self, shipping_type, product_ids, order_id, due_date):
+    def validate_shipping(self, shipping_type, due_date):
         if shipping_type not in self.list_available_shipping_type():
             raise ValueError("Shipping type is not available")
 
         if due_date <= datetime.now(timezone.utc):
             raise ValueError("Shipping due datetime must be greater than datetime now")
 
+    def create_shipping(self, shipping_type, product_ids, order_id, due_date):
+        self.validate_shipping(shipping_type, due_date)
+
+        if self.create_mode == self.CREATE_MODE_SINGLE_WRITE:
+            shipping_id = self.repository.new_shipping_id()
+            self.publisher.send_new_shipping(shipping_id)
+            # if the put fails the order fails, consumers retry the published id and drop it
+            # after MISSING_SHIPPING_GRACE_SECONDS
+            self.repository.create_shipping(
+                shipping_type, product_ids, order_id, self.SHIPPING_IN_PROGRESS, due_date, shipping_id=shipping_id
+            )
+            self.index_products_later([{"shipping_id": shipping_id, "product_ids": product_ids}])
+            return shipping_id
+
+        if self.create_mode == self.CREATE_MODE_OUTBOX:
+            # ShippingOutboxRelay writes the product index rows
+            return self.repository.create_shipping_with_outbox(
+                shipping_type, product_ids, order_id, self.SHIPPING_IN_PROGRESS, due_date
+            )
+
         shipping_id = self.repository.create_shipping(shipping_type, product_ids, order_id, self.SHIPPING_CREATED, due_date)
+        self.index_products_later([{"shipping_id": shipping_id, "product_ids": product_ids}])
 
         self.publisher.send_new_shipping(shipping_id)
         self.repository.update_shipping_status(shipping_id, self.SHIPPING_IN_PROGRESS)
 
         return shipping_id
 
+    def create_shippings(self, requests):
+        """
+        Bulk variant of create_shipping. Every request is a dict with the
+        create_shipping arguments; the result list is aligned with requests and
+        holds {"order_id", "shipping_id", "error"} for each of them.
+        """
+        results = []
+        valid = []
+        for request in requests:
+            result = {"order_id": request["order_id"], "shipping_id": None, "error": None}
+            try:
+                self.validate_shipping(request["shipping_type"], request["due_date"])
+            except ValueError as error:
+                result["error"] = error
+            else:
+                valid.append((result, request))
+            results.append(result)
+
+        if not valid:
+            return results
+
+        if self.create_mode == self.CREATE_MODE_SINGLE_WRITE:
+            self._create_shippings_single_write(valid)
+        elif self.create_mode == self.CREATE_MODE_OUTBOX:
+            self._create_shippings_outbox(valid)
+        else:
+            self._create_shippings_two_phase(valid)
+
+        return results
+
+    @staticmethod
+    def _write_in_chunks(write, pairs, chunk_size):
+        """
+        Writes the items of (result, item) pairs chunk by chunk. A failed chunk
+        records its error on its results, the pairs that were written are returned.
+        """
+        written = []
+        for start in range(0, len(pairs), chunk_size):
+            chunk = pairs[start:start + chunk_size]
+            try:
+                write([item for _, item in chunk])
+            except Exception as error:
+                for result, _ in chunk:
+                    result["error"] = error
+            else:
+                written.extend(chunk)
+
+        return written
+
+    def _create_shippings_two_phase(self, valid):
+        items = self.repository.build_shipping_items(
+            [(r["shipping_type"], r["product_ids"], r["order_id"], r["due_date"]) for _, r in valid],
+            self.SHIPPING_CREATED
+        )
+        written = self._write_in_chunks(
+            self.repository.put_shippings,
+            [(result, item) for (result, _), item in zip(valid, items)],
+            ShippingRepository.BATCH_WRITE_SIZE
+        )
+        self.index_products_later([item for _, item in written])
+        sent = self.publisher.send_new_shippings([item["shipping_id"] for _, item in written])
+
+        in_progress = []
+        for result, item in written:
+            result["shipping_id"] = item["shipping_id"]
+            if item["shipping_id"] in sent:
+                in_progress.append((result, dict(item, shipping_status=self.SHIPPING_IN_PROGRESS)))
+            else:
+                result["error"] = RuntimeError("Shipping was not published")
+        # a failed chunk here leaves published shippings in 'created', their results carry the error
+        self._write_in_chunks(self.repository.put_shippings, in_progress, ShippingRepository.BATCH_WRITE_SIZE)
+
+    def _create_shippings_single_write(self, valid):
+        """
+        Unlike create_shipping the puts are not conditional, BatchWriteItem does not
+        support conditions. The ids are fresh uuid4 values, so nothing is overwritten.
+        """
+        shipping_ids = [self.repository.new_shipping_id() for _ in valid]
+        sent = self.publisher.send_new_shippings(shipping_ids)
+
+        published = []
+        for (result, request), shipping_id in zip(valid, shipping_ids):
+            if shipping_id in sent:
+                published.append((result, request, shipping_id))
+            else:
+                result["error"] = RuntimeError("Shipping was not published")
+        items = self.repository.build_shipping_items(
+            [(r["shipping_type"], r["product_ids"], r["order_id"], r["due_date"]) for _, r, _ in published],
+            self.SHIPPING_IN_PROGRESS,
+            shipping_ids=[shipping_id for _, _, shipping_id in published]
+        )
+        written = self._write_in_chunks(
+            self.repository.put_shippings,
+            [(result, item) for (result, _, _), item in zip(published, items)],
+            ShippingRepository.BATCH_WRITE_SIZE
+        )
+        for result, item in written:
+            result["shipping_id"] = item["shipping_id"]
+        self.index_products_later([item for _, item in written])
+
+    def _create_shippings_outbox(self, valid):
+        items = self.repository.build_shipping_items(
+            [(r["shipping_type"], r["product_ids"], r["order_id"], r["due_date"]) for _, r in valid],
+            self.SHIPPING_IN_PROGRESS
+        )
+        # every chunk is its own transaction, a failed one does not roll back the others
+        written = self._write_in_chunks(
+            self.repository.put_shippings_with_outbox,
+            [(result, item) for (result, _), item in zip(valid, items)],
+            ShippingRepository.OUTBOX_TRANSACTION_SIZE
+        )
+        for result, item in written:
+            result["shipping_id"] = item["shipping_id"]
+
+    def index_products_later(self, items):
+        """
+        Writes the product index rows of the written shipping items in the background, so
+        creating shippings stays a single write. A failed write is logged, its rows are missing.
+        """
+        if not items:
+            return
+        future = self.executor.submit(self.repository.index_products, items)
+        self._indexing.add(future)
+        future.add_done_callback(self._indexed)
+
+    def _indexed(self, future):
+        self._indexing.discard(future)
+        if future.exception() is not None:
+            logger.error("Could not write product index rows", exc_info=future.exception())
+
+    def wait_for_index(self):
+        """Waits for the product index writes started so far."""
+        wait(list(self._indexing))
+
     def process_shipping_batch(self):
-        result = []
-        shipping = self.publisher.poll_shipping()
-        for shipping_id in shipping:
-            shipping = self.process_shipping(shipping_id)
-            result.append(shipping)
+        messages = self.publisher.poll_shipping_messages()
+        if not messages:
+            return []
+
+        receipt_handles = [message.receipt_handle for message in messages]
+        # a slow or throttled batch is not redelivered to another consumer meanwhile
+        self.heartbeat.start()
+        self.heartbeat.track(receipt_handles)
+        try:
+            results = self.process_shipping_messages(messages)
+            self.flush_statuses()
+        finally:
+            self.heartbeat.untrack(receipt_handles)
+        self.publisher.acknowledge_shippings([
+            message.receipt_handle
+            for message, result in zip(messages, results)
+            if self.should_acknowledge(message, result)
+        ])
+        released = [
+            message.receipt_handle
+            for message, result in zip(messages, results)
+            if self.should_release(message, result)
+        ]
+        if released:
+            self.publisher.release_shippings(released)
+
+        return results
+
+    def should_acknowledge(self, message, result):
+        # failed messages are not acknowledged and become visible again for a retry
+        if result["error"] is None:
+            return True
+
+        # get_shippings leaves out keys it could not read, confirm the shipping is really missing
+        if isinstance(result["error"], ShippingNotFoundError) and message.sent_timestamp is not None \
+                and time.time() - message.sent_timestamp > self.MISSING_SHIPPING_GRACE_SECONDS \
+                and self.repository.get_shipping(message.shipping_id, fields=['shipping_id'], consistent_read=True) is None:
+            logger.warning("Dropping message for shipping %s that was never written", message.shipping_id)
+            return True
+
+        return False
+
+    def should_release(self, message, result):
+        # a missing shipping may still be written, it waits out the visibility timeout instead
+        return result["error"] is not None and not isinstance(result["error"], ShippingNotFoundError) \
+            and not self.should_acknowledge(message, result)
 
-        return result
+    def process_shipping_messages(self, messages):
+        """Returns {"shipping_id", "response", "error"} for every message, in the same order."""
+        shippings = self.repository.get_shippings(
+            [message.shipping_id for message in messages], fields=self.PROCESS_FIELDS
+        )
+        futures = [
+            self.executor.submit(self._process_loaded_shipping, message.shipping_id, shippings.get(message.shipping_id))
+            for message in messages
+        ]
+
+        results = []
+        for message, future in zip(messages, futures):
+            error = future.exception()
+            results.append({
+                "shipping_id": message.shipping_id,
+                "response": None if error else future.result(),
+                "error": error
+            })
+
+        return results
 
     def process_shipping(self, shipping_id):
-        shipping = self.repository.get_shipping(shipping_id)
-        if datetime.fromisoformat(shipping['due_date']) < datetime.now(timezone.utc):
+        shipping = self.repository.get_shipping(shipping_id, fields=self.PROCESS_FIELDS)
+        return self._process_loaded_shipping(shipping_id, shipping)
+
+    def _process_loaded_shipping(self, shipping_id, shipping):
+        if shipping is None:
+            raise ShippingNotFoundError(f"Shipping {shipping_id} not found")
+
+        if decode_date(shipping['due_date']) < datetime.now(timezone.utc):
             return self.fail_shipping(shipping_id)
 
         return self.complete_shipping(shipping_id)
 
-    def check_status(self, shipping_id):
-        shipping = self.repository.get_shipping(shipping_id)
+    def find_shippings_by_product(self, product_id, fields: list = None):
+        """Returns the shippings that contain product_id, through the product index."""
+        shipping_ids = list(self.repository.iter_shipping_ids_by_product(str(product_id)))
+        shippings = self.repository.get_shippings(shipping_ids, fields=fields)
+        return [shippings[shipping_id] for shipping_id in shipping_ids if shipping_id in shippings]
+
+    def fail_overdue_shippings(self, now: datetime = None, page_size: int = 100):
+        """Fails every in progress shipping that is past its due date, returns how many were failed."""
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        failed = 0
+        page = []
+        for shipping in self.repository.iter_overdue(now, self.SHIPPING_IN_PROGRESS, page_size):
+            page.append(shipping['shipping_id'])
+            if len(page) == page_size:
+                failed += self._fail_in_progress(page)
+                page = []
+        if page:
+            failed += self._fail_in_progress(page)
+
+        return failed
+
+    def _fail_in_progress(self, shipping_ids):
+        # conditional, a shipping completed since the query is left alone
+        futures = [
+            self.executor.submit(
+                self.repository.update_shipping_status_if, shipping_id, self.SHIPPING_FAILED, self.SHIPPING_IN_PROGRESS
+            )
+            for shipping_id in shipping_ids
+        ]
+        return sum(1 for future in futures if future.result())
+
+    def check_status(self, shipping_id, consistent_read: bool = False):
+        shipping = self.repository.get_shipping(shipping_id, fields=self.STATUS_FIELDS, consistent_read=consistent_read)
 
         return shipping['shipping_status']
 
+    def check_statuses(self, shipping_ids):
+        """Returns {shipping_id: status} with batched reads, missing shippings are left out."""
+        shippings = self.repository.get_shippings(shipping_ids, fields=self.STATUS_FIELDS)
+        return {shipping_id: shipping['shipping_status'] for shipping_id, shipping in shippings.items()}
+
+    def find_shipping_ids_by_order(self, order_id):
+        return [shipping['shipping_id'] for shipping in self.repository.iter_by_order(order_id)]
+
     def fail_shipping(self, shipping_id):
         response = self.repository.update_shipping_status(shipping_id, self.SHIPPING_FAILED)
         return response['ResponseMetadata']
@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures import Future
+
+from .cache import TTLCache
+from .config import SHIPPING_NEGATIVE_CACHE_SIZE, SHIPPING_NEGATIVE_CACHE_TTL
+
+
+class SingleFlight:
+    """Runs one call per key at a time, callers that arrive meanwhile wait for its result."""
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Returns (result, shared), shared tells whether another caller's call was joined."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            future.set_result(function())
+        except BaseException as error:
+            future.set_exception(error)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result(), False
+
+
+class SingleFlightShippingRepository:
+    """
+    Coalesces concurrent get_shipping calls for the same shipping, projection and
+    consistency into one read, and remembers missing shippings for `negative_ttl`
+    seconds. Consistent reads never use the negative cache, writes made through it
+    clear it. Everything else is delegated to the repository.
+    """
+
+    def __init__(self, repository, negative_ttl: float = SHIPPING_NEGATIVE_CACHE_TTL,
+                 negative_size: int = SHIPPING_NEGATIVE_CACHE_SIZE):
+        self.repository = repository
+        self.flight = SingleFlight()
+        self.missing = TTLCache(negative_size, negative_ttl)
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    def get_shipping(self, shipping_id, fields: list = None, consistent_read: bool = False):
+        if not consistent_read and self.missing.get(shipping_id) is not None:
+            return None
+
+        key = (shipping_id, tuple(fields) if fields else None, consistent_read)
+        shipping, shared = self.flight.do(key, lambda: self.repository.get_shipping(shipping_id, fields, consistent_read))
+        if shipping is None:
+            self.missing.set(shipping_id, True)
+            return None
+        if consistent_read:
+            self.missing.invalidate(shipping_id)
+        # every caller gets its own item to modify
+        return dict(shipping) if shared else shipping
+
+    def create_shipping(self, *args, **kwargs):
+        shipping_id = self.repository.create_shipping(*args, **kwargs)
+        self.missing.invalidate(shipping_id)
+        return shipping_id
+
+    def create_shipping_with_outbox(self, *args, **kwargs):
+        shipping_id = self.repository.create_shipping_with_outbox(*args, **kwargs)
+        self.missing.invalidate(shipping_id)
+        return shipping_id
+
+    def create_shippings(self, shippings: list, status: str, shipping_ids: list = None):
+        items = self.build_shipping_items(shippings, status, shipping_ids)
+        self.put_shippings(items)
+        return items
+
+    def put_shippings(self, items: list):
+        try:
+            return self.repository.put_shippings(items)
+        finally:
+            self._invalidate(items)
+
+    def put_shippings_with_outbox(self, items: list):
+        try:
+            return self.repository.put_shippings_with_outbox(items)
+        finally:
+            self._invalidate(items)
+
+    def update_shipping_status(self, shipping_id, status):
+        # update_item creates missing shippings
+        try:
+            return self.repository.update_shipping_status(shipping_id, status)
+        finally:
+            self.missing.invalidate(shipping_id)
+
+    def stats(self):
+        return {"calls": self.flight.calls, "shared": self.flight.shared, **{
+            f"missing_{name}": value for name, value in self.missing.stats().items()
+        }}
+
+    def _invalidate(self, items):
+        for item in items:
+            self.missing.invalidate(item["shipping_id"])
@@ -0,0 +1,224 @@
+import json
+import math
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+from .config import SHIPPING_SQLITE_PATH
+from .product_ids import decode_product_ids
+from .repository import ShippingRepository
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shippings (
+    shipping_id TEXT PRIMARY KEY,
+    shipping_type TEXT,
+    order_id TEXT,
+    product_ids,
+    shipping_status TEXT,
+    created_date,
+    due_date,
+    due_epoch INTEGER
+);
+CREATE INDEX IF NOT EXISTS shippings_order_id ON shippings (order_id);
+CREATE INDEX IF NOT EXISTS shippings_status_due ON shippings (shipping_status, due_epoch);
+CREATE INDEX IF NOT EXISTS shippings_due_epoch ON shippings (due_epoch);
+CREATE TABLE IF NOT EXISTS shipping_outbox (
+    shipping_id TEXT PRIMARY KEY,
+    created_date
+);
+CREATE TABLE IF NOT EXISTS shipping_products (
+    product_id TEXT,
+    shipping_id TEXT,
+    PRIMARY KEY (product_id, shipping_id)
+) WITHOUT ROWID;
+"""
+
+COLUMNS = ("shipping_id", "shipping_type", "order_id", "product_ids", "shipping_status", "created_date", "due_date",
+           "due_epoch")
+
+_INSERT = f"INSERT INTO shippings ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})"
+_UPSERT = _INSERT.replace("INSERT", "INSERT OR REPLACE", 1)
+
+
+class SqliteShippingRepository(ShippingRepository):
+    """
+    ShippingRepository on a local SQLite database in WAL mode, for single node
+    deployments without AWS. Every thread gets its own connection, statements are
+    constant and parameterized so sqlite3 reuses the prepared statements.
+    """
+
+    # SQLite allows 999 bound parameters per statement on older builds
+    BATCH_GET_SIZE: int = 500
+
+    def __init__(self, path: str = SHIPPING_SQLITE_PATH, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.connection.executescript(_SCHEMA)
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps the database consistent with NORMAL, only the last commits can be lost on power failure
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def get_shipping(self, shipping_id, fields: list = None, consistent_read: bool = False):
+        columns = self._columns(fields)
+        row = self.connection.execute(
+            f"SELECT {', '.join(columns)} FROM shippings WHERE shipping_id = ?", (shipping_id,)
+        ).fetchone()
+        return self._load_row(columns, row) if row is not None else None
+
+    def get_shippings(self, shipping_ids, fields: list = None, max_attempts: int = 5):
+        columns = self._columns(["shipping_id"] + [field for field in fields if field != "shipping_id"] if fields else None)
+        unique_ids = list(dict.fromkeys(shipping_ids))
+        items = {}
+        for start in range(0, len(unique_ids), self.BATCH_GET_SIZE):
+            chunk = unique_ids[start:start + self.BATCH_GET_SIZE]
+            rows = self.connection.execute(
+                f"SELECT {', '.join(columns)} FROM shippings WHERE shipping_id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            )
+            for row in rows:
+                item = self._load_row(columns, row)
+                items[item["shipping_id"]] = item
+        return items
+
+    def create_shipping(self, shipping_type: str, product_ids: list, order_id: str, status: str, due_date: datetime,
+                        shipping_id: str = None):
+        item = self._build_shipping_item(shipping_type, product_ids, order_id, status, due_date, shipping_id)
+        with self.connection as connection:
+            # a known id must not overwrite an existing shipping, the plain insert fails with IntegrityError
+            connection.execute(_INSERT if shipping_id else _UPSERT, self._row(item))
+        return item["shipping_id"]
+
+    def put_shippings(self, items: list):
+        with self.connection as connection:
+            connection.executemany(_UPSERT, [self._row(item) for item in items])
+
+    def put_shippings_with_outbox(self, items: list):
+        with self.connection as connection:
+            connection.executemany(_INSERT, [self._row(item) for item in items])
+            connection.executemany(
+                "INSERT INTO shipping_outbox (shipping_id, created_date) VALUES (?, ?)",
+                [(item["shipping_id"], self._value(item["created_date"])) for item in items]
+            )
+
+    def index_products(self, items: list, max_attempts: int = 5):
+        with self.connection as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO shipping_products (product_id, shipping_id) VALUES (?, ?)",
+                [(product_id, item["shipping_id"]) for item in items for product_id in decode_product_ids(item["product_ids"])]
+            )
+
+    def iter_shipping_ids_by_product(self, product_id: str, page_size: int = 100):
+        rows = self.connection.execute(
+            "SELECT shipping_id FROM shipping_products WHERE product_id = ? ORDER BY shipping_id", (product_id,)
+        )
+        for (shipping_id,) in rows:
+            yield shipping_id
+
+    def get_outbox(self, limit: int = 100, start_key: dict = None):
+        rows = self.connection.execute(
+            "SELECT shipping_id, created_date FROM shipping_outbox WHERE shipping_id > ? ORDER BY shipping_id LIMIT ?",
+            (start_key["shipping_id"] if start_key else "", limit + 1)
+        ).fetchall()
+        records = [{"shipping_id": shipping_id, "created_date": created_date} for shipping_id, created_date in rows[:limit]]
+        return records, {"shipping_id": records[-1]["shipping_id"]} if len(rows) > limit else None
+
+    def delete_outbox(self, shipping_ids: list):
+        with self.connection as connection:
+            connection.executemany("DELETE FROM shipping_outbox WHERE shipping_id = ?",
+                                   [(shipping_id,) for shipping_id in shipping_ids])
+
+    def update_shipping_status(self, shipping_id, status):
+        self.update_shipping_statuses({shipping_id: status})
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def update_shipping_statuses(self, statuses: dict):
+        with self.connection as connection:
+            # creates a missing shipping like DynamoDB's update_item does
+            connection.executemany(
+                "INSERT INTO shippings (shipping_id, shipping_status) VALUES (?, ?) "
+                "ON CONFLICT (shipping_id) DO UPDATE SET shipping_status = excluded.shipping_status",
+                list(statuses.items())
+            )
+
+    def update_shipping_status_if(self, shipping_id, status, expected_status):
+        with self.connection as connection:
+            cursor = connection.execute(
+                "UPDATE shippings SET shipping_status = ? WHERE shipping_id = ? AND shipping_status = ?",
+                (status, shipping_id, expected_status)
+            )
+        return cursor.rowcount == 1
+
+    def iter_overdue(self, now: datetime, status: str, page_size: int = 100):
+        # keyset pagination, pages stay correct while the caller updates the yielded shippings
+        last = (-math.inf, "")
+        while True:
+            rows = self.connection.execute(
+                "SELECT shipping_id, due_epoch FROM shippings "
+                "WHERE shipping_status = ? AND due_epoch < ? AND (due_epoch, shipping_id) > (?, ?) "
+                "ORDER BY due_epoch, shipping_id LIMIT ?",
+                (status, math.floor(now.timestamp()), last[0], last[1], page_size)
+            ).fetchall()
+            for shipping_id, due_epoch in rows:
+                yield {"shipping_id": shipping_id, "shipping_status": status, "due_epoch": due_epoch}
+            if len(rows) < page_size:
+                return
+            last = (rows[-1][1], rows[-1][0])
+
+    def get_order_page(self, order_id, limit: int = 100, start_key: dict = None):
+        order_id = str(order_id)
+        rows = self.connection.execute(
+            "SELECT shipping_id FROM shippings WHERE order_id = ? AND shipping_id > ? ORDER BY shipping_id LIMIT ?",
+            (order_id, start_key["shipping_id"] if start_key else "", limit + 1)
+        ).fetchall()
+        items = [{"shipping_id": shipping_id, "order_id": order_id} for (shipping_id,) in rows[:limit]]
+        return items, {"shipping_id": items[-1]["shipping_id"]} if len(rows) > limit else None
+
+    @staticmethod
+    def _columns(fields):
+        # only known columns reach the SQL text, unknown fields are missing attributes as in DynamoDB
+        if not fields:
+            return COLUMNS
+        return [field for field in fields if field in COLUMNS] or ["shipping_id"]
+
+    @classmethod
+    def _row(cls, item):
+        return tuple(cls._value(item.get(column)) if column != "product_ids" else cls._product_ids(item[column])
+                     for column in COLUMNS)
+
+    @staticmethod
+    def _value(value):
+        # epoch dates are Decimal, which sqlite3 does not bind
+        return float(value) if isinstance(value, Decimal) else value
+
+    @staticmethod
+    def _product_ids(value):
+        # lists are stored as JSON text, packed product ids as a blob
+        return json.dumps(value, ensure_ascii=False) if isinstance(value, list) else value
+
+    def _load_row(self, columns, row):
+        item = {column: value for column, value in zip(columns, row) if value is not None}
+        if isinstance(item.get("product_ids"), str):
+            item["product_ids"] = json.loads(item["product_ids"])
+        return self._load_item(item)
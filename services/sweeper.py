@@ -0,0 +1,37 @@
+import argparse
+import logging
+import signal
+import threading
+
+from .service import ShippingService
+from .backends import create_repository, create_publisher
+
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail in progress shippings that are past their due date")
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds between sweeps")
+    parser.add_argument("--once", action="store_true", help="sweep once and exit")
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    service = ShippingService(create_repository(), create_publisher())
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+
+    while True:
+        try:
+            logger.info("Failed %d overdue shippings", service.fail_overdue_shippings(page_size=args.page_size))
+        except Exception:
+            logger.exception("Sweeping overdue shippings failed")
+        if args.once or stopped.wait(args.interval):
+            break
+    service.close()
+
+
+if __name__ == "__main__":
+    main()
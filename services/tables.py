@@ -0,0 +1,105 @@
+import argparse
+
+from .config import SHIPPING_TABLE_NAME, SHIPPING_OUTBOX_TABLE_NAME, SHIPPING_PRODUCT_TABLE_NAME
+from .db import get_client
+
+# in progress shippings by due date, sparse: only items with due_epoch are indexed
+STATUS_DUE_INDEX = "shipping_status-due_epoch-index"
+# shippings of an order
+ORDER_INDEX = "order_id-index"
+
+
+def shipping_table_definitions():
+    return [
+        {
+            "TableName": SHIPPING_TABLE_NAME,
+            "KeySchema": [{"AttributeName": "shipping_id", "KeyType": "HASH"}],
+            "AttributeDefinitions": [
+                {"AttributeName": "shipping_id", "AttributeType": "S"},
+                {"AttributeName": "shipping_status", "AttributeType": "S"},
+                {"AttributeName": "due_epoch", "AttributeType": "N"},
+                {"AttributeName": "order_id", "AttributeType": "S"},
+            ],
+            "GlobalSecondaryIndexes": [
+                {
+                    "IndexName": STATUS_DUE_INDEX,
+                    "KeySchema": [
+                        {"AttributeName": "shipping_status", "KeyType": "HASH"},
+                        {"AttributeName": "due_epoch", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "KEYS_ONLY"},
+                },
+                {
+                    "IndexName": ORDER_INDEX,
+                    "KeySchema": [{"AttributeName": "order_id", "KeyType": "HASH"}],
+                    "Projection": {"ProjectionType": "KEYS_ONLY"},
+                },
+            ],
+            "BillingMode": "PAY_PER_REQUEST",
+        },
+        {
+            # written together with the shipping in outbox mode, drained by ShippingOutboxRelay
+            "TableName": SHIPPING_OUTBOX_TABLE_NAME,
+            "KeySchema": [{"AttributeName": "shipping_id", "KeyType": "HASH"}],
+            "AttributeDefinitions": [{"AttributeName": "shipping_id", "AttributeType": "S"}],
+            "BillingMode": "PAY_PER_REQUEST",
+        },
+        {
+            # one row per product of a shipping, list elements cannot be indexed by a GSI
+            "TableName": SHIPPING_PRODUCT_TABLE_NAME,
+            "KeySchema": [
+                {"AttributeName": "product_id", "KeyType": "HASH"},
+                {"AttributeName": "shipping_id", "KeyType": "RANGE"},
+            ],
+            "AttributeDefinitions": [
+                {"AttributeName": "product_id", "AttributeType": "S"},
+                {"AttributeName": "shipping_id", "AttributeType": "S"},
+            ],
+            "BillingMode": "PAY_PER_REQUEST",
+        },
+    ]
+
+
+def create_shipping_tables(dynamo_client):
+    """
+    Creates the shipping tables and indexes that do not exist yet, returns the
+    names of what was created.
+    """
+    existing_tables = dynamo_client.list_tables()["TableNames"]
+    created = []
+    for definition in shipping_table_definitions():
+        if definition["TableName"] in existing_tables:
+            created.extend(_create_missing_indexes(dynamo_client, definition))
+            continue
+        dynamo_client.create_table(**definition)
+        dynamo_client.get_waiter("table_exists").wait(TableName=definition["TableName"])
+        created.append(definition["TableName"])
+
+    return created
+
+
+def _create_missing_indexes(dynamo_client, definition):
+    table = dynamo_client.describe_table(TableName=definition["TableName"])["Table"]
+    existing_indexes = {index["IndexName"] for index in table.get("GlobalSecondaryIndexes", [])}
+    created = []
+    for index in definition.get("GlobalSecondaryIndexes", []):
+        if index["IndexName"] in existing_indexes:
+            continue
+        # DynamoDB builds (backfills) one new index at a time, the call returns right away
+        dynamo_client.update_table(
+            TableName=definition["TableName"],
+            AttributeDefinitions=definition["AttributeDefinitions"],
+            GlobalSecondaryIndexUpdates=[{"Create": index}],
+        )
+        created.append(f'{definition["TableName"]}.{index["IndexName"]}')
+    return created
+
+
+def main(argv=None):
+    argparse.ArgumentParser(description="Create the shipping DynamoDB tables").parse_args(argv)
+    for table_name in create_shipping_tables(get_client("dynamodb")):
+        print(f"Created {table_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import logging
+import queue
+import signal
+import threading
+import time
+
+from .service import ShippingService
+from .publisher import ShippingPublisher
+from .backends import create_repository, create_publisher
+from .outbox import ShippingOutboxRelay
+
+
+logger = logging.getLogger(__name__)
+
+
+class ShippingWorker:
+    """
+    Runs `pollers` threads receiving batches of shipping messages from the queue
+    and `processors` threads processing them. The bounded buffer of batches
+    between them stops polling while processing is behind.
+    """
+    FINAL_ACKNOWLEDGE_ATTEMPTS: int = 3
+
+    def __init__(self, service: ShippingService, pollers: int = 2, processors: int = 8,
+                 buffer_size: int = None, stats_interval: float = 1.0, acknowledge_interval: float = 0.2):
+        self.service = service
+        self.pollers = pollers
+        self.processors = processors
+        self.stats_interval = stats_interval
+        self.acknowledge_interval = acknowledge_interval
+        self.processed = 0
+        self.failed = 0
+        self._buffer = queue.Queue(maxsize=buffer_size or processors * 2)
+        self._stopping = threading.Event()
+        self._drained = threading.Event()
+        self._lock = threading.Lock()
+        self._processed_receipts = []
+        # messages stay invisible from receive until they are acknowledged or released
+        self.heartbeat = service.heartbeat
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        poller_threads = [
+            threading.Thread(target=self._poll, name=f"shipping-poller-{i}", daemon=True)
+            for i in range(self.pollers)
+        ]
+        processor_threads = [
+            threading.Thread(target=self._process, name=f"shipping-processor-{i}", daemon=True)
+            for i in range(self.processors)
+        ]
+        acknowledge_thread = threading.Thread(target=self._acknowledge_periodically, name="shipping-ack", daemon=True)
+        for thread in poller_threads + processor_threads + [acknowledge_thread]:
+            thread.start()
+        self.heartbeat.start()
+
+        last_processed, last_failed = 0, 0
+        while not self._stopping.wait(self.stats_interval):
+            with self._lock:
+                processed, failed = self.processed, self.failed
+            logger.info("processed %.1f/s, failed %.1f/s, buffered %d",
+                        (processed - last_processed) / self.stats_interval,
+                        (failed - last_failed) / self.stats_interval,
+                        self._buffer.qsize())
+            last_processed, last_failed = processed, failed
+
+        logger.info("Stopping, draining %d buffered shippings", self._buffer.qsize())
+        for thread in poller_threads:
+            thread.join()
+        for _ in processor_threads:
+            self._buffer.put(None)
+        for thread in processor_threads:
+            thread.join()
+        self._drained.set()
+        acknowledge_thread.join()
+        self.heartbeat.stop()
+        for attempt in range(self.FINAL_ACKNOWLEDGE_ATTEMPTS):
+            if self._acknowledge():
+                break
+            time.sleep(0.1 * 2 ** attempt)
+        else:
+            logger.error("%d processed shippings were not acknowledged", len(self._processed_receipts))
+        logger.info("Stopped, processed %d, failed %d", self.processed, self.failed)
+
+    def _poll(self):
+        while not self._stopping.is_set():
+            try:
+                messages = self.service.publisher.poll_shipping_messages()
+            except Exception:
+                logger.exception("Polling shippings failed")
+                time.sleep(1)
+                continue
+            if messages:
+                self.heartbeat.track([message.receipt_handle for message in messages])
+                self._buffer.put(messages)
+
+    def _process(self):
+        while True:
+            messages = self._buffer.get()
+            if messages is None:
+                return
+            try:
+                # one batched read and concurrent updates for the whole poll
+                results = self.service.process_shipping_messages(messages)
+            except Exception:
+                logger.exception("Processing %d shippings failed", len(messages))
+                with self._lock:
+                    self.failed += len(messages)
+                self._release([message.receipt_handle for message in messages])
+                continue
+
+            receipt_handles = []
+            released = []
+            for message, result in zip(messages, results):
+                if result["error"] is not None:
+                    logger.warning("Processing shipping %s failed: %r", message.shipping_id, result["error"])
+                if self.service.should_acknowledge(message, result):
+                    receipt_handles.append(message.receipt_handle)
+                elif self.service.should_release(message, result):
+                    released.append(message.receipt_handle)
+            self.heartbeat.untrack([message.receipt_handle for message in messages])
+            self._release(released)
+            succeeded = sum(1 for result in results if result["error"] is None)
+
+            with self._lock:
+                self.processed += succeeded
+                self.failed += len(results) - succeeded
+                self._processed_receipts.extend(receipt_handles)
+                ready = len(self._processed_receipts) >= ShippingPublisher.DELETE_BATCH_SIZE
+            if ready:
+                self._acknowledge()
+
+    def _release(self, receipt_handles):
+        # failed messages become visible right away instead of after the visibility timeout
+        self.heartbeat.untrack(receipt_handles)
+        if not receipt_handles:
+            return
+        try:
+            self.service.publisher.release_shippings(receipt_handles)
+        except Exception:
+            logger.exception("Releasing %d shippings failed", len(receipt_handles))
+
+    def _acknowledge_periodically(self):
+        while not self._drained.wait(self.acknowledge_interval):
+            self._acknowledge()
+
+    def _acknowledge(self):
+        with self._lock:
+            receipt_handles, self._processed_receipts = self._processed_receipts, []
+        if not receipt_handles:
+            return True
+        try:
+            self.service.flush_statuses()
+            failed = self.service.publisher.acknowledge_shippings(receipt_handles)
+        except Exception:
+            logger.exception("Acknowledging %d shippings failed, will retry", len(receipt_handles))
+            with self._lock:
+                self._processed_receipts[:0] = receipt_handles
+            return False
+        if failed:
+            logger.warning("Could not acknowledge %d shippings", len(failed))
+        return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process shippings from the shipping queue")
+    parser.add_argument("--pollers", type=int, default=2)
+    parser.add_argument("--processors", type=int, default=8)
+    parser.add_argument("--buffer-size", type=int, default=None)
+    parser.add_argument("--outbox-relay", action="store_true",
+                        help="also publish shippings created in outbox mode (see python -m services.outbox)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s %(message)s")
+    service = ShippingService(create_repository(), create_publisher())
+    worker = ShippingWorker(
+        service,
+        pollers=args.pollers,
+        processors=args.processors,
+        buffer_size=args.buffer_size,
+    )
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+
+    relay = ShippingOutboxRelay(service.repository, service.publisher) if args.outbox_relay else None
+    if relay:
+        relay.start()
+    worker.run()
+    if relay:
+        relay.stop()
+    service.close()
+
+
+if __name__ == "__main__":
+    main()
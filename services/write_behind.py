@@ -0,0 +1,137 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import SHIPPING_WRITE_BEHIND_WINDOW, SHIPPING_WRITE_BEHIND_FLUSH_MODE
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindShippingRepository:
+    """
+    Buffers update_shipping_status in front of a ShippingRepository. Only the last
+    status per shipping is kept, pending statuses are written at most `window`
+    seconds later (sooner once max_pending are waiting) and on close(). Reads through
+    it see the pending statuses, everything else is delegated to the repository.
+    """
+
+    FLUSH_MODE_PARALLEL: str = 'parallel'
+    FLUSH_MODE_TRANSACTION: str = 'transaction'
+
+    ACCEPTED: dict = {"ResponseMetadata": {"HTTPStatusCode": 202}}
+
+    def __init__(self, repository, window: float = SHIPPING_WRITE_BEHIND_WINDOW,
+                 flush_mode: str = SHIPPING_WRITE_BEHIND_FLUSH_MODE, max_pending: int = 1000, max_workers: int = 10):
+        self.repository = repository
+        self.window = window
+        self.flush_mode = flush_mode
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shipping-write-behind") \
+            if flush_mode == self.FLUSH_MODE_PARALLEL else None
+        self.written = 0
+        self.coalesced = 0
+        self._pending = {}
+        # statuses of the running flush, reads still see them until they are written
+        self._flushing = {}
+        self._lock = threading.Lock()
+        # one flush at a time, a status is never written after a newer one
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="shipping-write-behind", daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        return getattr(self.repository, name)
+
+    def update_shipping_status(self, shipping_id, status):
+        with self._lock:
+            if shipping_id in self._pending:
+                self.coalesced += 1
+            self._pending[shipping_id] = status
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+        return self.ACCEPTED
+
+    def update_shipping_status_if(self, shipping_id, status, expected_status):
+        # the condition has to see the pending status
+        self.flush()
+        return self.repository.update_shipping_status_if(shipping_id, status, expected_status)
+
+    def get_shipping(self, shipping_id, fields: list = None, consistent_read: bool = False):
+        return self._overlay(shipping_id, self.repository.get_shipping(shipping_id, fields, consistent_read))
+
+    def get_shippings(self, shipping_ids, fields: list = None, *args, **kwargs):
+        shippings = self.repository.get_shippings(shipping_ids, fields, *args, **kwargs)
+        return {shipping_id: self._overlay(shipping_id, shipping) for shipping_id, shipping in shippings.items()}
+
+    def flush(self):
+        """Writes the pending statuses, the ones that could not be written stay pending and an error is raised."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._flushing = pending
+            if not pending:
+                return
+            try:
+                failed = self._write(pending)
+            except Exception:
+                self._requeue(pending)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+            self._requeue(failed)
+            self.written += len(pending) - len(failed)
+            if failed:
+                raise RuntimeError(f"Could not write the status of {len(failed)} shippings")
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def stats(self):
+        with self._lock:
+            return {"pending": len(self._pending), "written": self.written, "coalesced": self.coalesced}
+
+    def _write(self, statuses):
+        """Returns the statuses that were not written."""
+        if self.flush_mode == self.FLUSH_MODE_TRANSACTION:
+            self.repository.update_shipping_statuses(statuses)
+            return {}
+        futures = [
+            self.executor.submit(self.repository.update_shipping_status, shipping_id, status)
+            for shipping_id, status in statuses.items()
+        ]
+        return {
+            shipping_id: status
+            for (shipping_id, status), future in zip(statuses.items(), futures) if future.exception() is not None
+        }
+
+    def _requeue(self, statuses):
+        if statuses:
+            with self._lock:
+                # statuses set meanwhile are newer than the failed ones
+                self._pending = {**statuses, **self._pending}
+
+    def _overlay(self, shipping_id, shipping):
+        with self._lock:
+            status = self._pending.get(shipping_id, self._flushing.get(shipping_id))
+        if shipping is not None and status is not None and "shipping_status" in shipping:
+            shipping["shipping_status"] = status
+        return shipping
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.window)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing shipping statuses failed, will retry")
@@ -8,8 +8,22 @@ from services.config import *
 from services.db import get_dynamodb_resource
 from dotenv import load_dotenv
 
-from services.publisher import ShippingPublisher
-from services.repository import ShippingRepository
+from services.backends import create_repository, create_publisher
+from services.memory import reset_memory_backend
+from services.tables import create_shipping_tables, shipping_table_definitions
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "aws: needs DynamoDB and SQS (LocalStack), skipped with SHIPPING_BACKEND=memory")
+
+
+def pytest_collection_modifyitems(config, items):
+    if SHIPPING_BACKEND != "memory":
+        return
+    skip_aws = pytest.mark.skip(reason="SHIPPING_BACKEND=memory")
+    for item in items:
+        if "aws" in item.keywords:
+            item.add_marker(skip_aws)
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -18,20 +32,17 @@ def load_env():
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_localstack_resources():
+    if SHIPPING_BACKEND == "memory":
+        yield
+        reset_memory_backend()
+        return
+
     dynamo_client = boto3.client(
         "dynamodb",
         endpoint_url=AWS_ENDPOINT_URL,
         region_name=AWS_REGION
     )
-    existing_tables = dynamo_client.list_tables()["TableNames"]
-    if SHIPPING_TABLE_NAME not in existing_tables:
-        dynamo_client.create_table(
-            TableName=SHIPPING_TABLE_NAME,
-            KeySchema=[{"AttributeName": "shipping_id", "KeyType": "HASH"}],
-            AttributeDefinitions=[{"AttributeName": "shipping_id", "AttributeType": "S"}],
-            BillingMode="PAY_PER_REQUEST",
-        )
-        dynamo_client.get_waiter("table_exists").wait(TableName=SHIPPING_TABLE_NAME)
+    create_shipping_tables(dynamo_client)
     sqs_client = boto3.client(
         "sqs",
         endpoint_url=AWS_ENDPOINT_URL, region_name=AWS_REGION
@@ -41,7 +52,8 @@ def setup_localstack_resources():
 
     yield  # Всі тести йдуть тут
 
-    dynamo_client.delete_table(TableName=SHIPPING_TABLE_NAME)
+    for definition in shipping_table_definitions():
+        dynamo_client.delete_table(TableName=definition["TableName"])
     sqs_client.delete_queue(QueueUrl=queue_url)
 
 
@@ -52,7 +64,7 @@ def dynamo_resource():
 
 @pytest.fixture
 def shipping_service():
-    return ShippingService(ShippingRepository(), ShippingPublisher())
+    return ShippingService(create_repository(), create_publisher())
 
 
 @pytest.fixture
@@ -1,6 +1,9 @@
 import unittest
-from app.eshop import Product, ShoppingCart
+from app.eshop import Order, Product, Shipment, ShoppingCart
+from app.pricing import CartPricingBatch, price_carts
+from app.catalog import ProductCatalog
 from unittest.mock import MagicMock
+from decimal import Decimal
 class TestCalculator(unittest.TestCase):
     def setUp(self):
         self.product = Product(name='Test', price=123.45, available_amount=21)
@@ -19,5 +22,135 @@ class TestCalculator(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.cart.add_product(self.product, 22)
         self.assertEqual(self.cart.contains_product(self.product), False, 'Продукт не доданий до корзини')
+class TestCartTotals(unittest.TestCase):
+    def setUp(self):
+        self.laptop = Product(name='Laptop', price=1000.0, available_amount=5)
+        self.phone = Product(name='Phone', price=500.0, available_amount=10)
+        self.cart = ShoppingCart()
+        self.cart.add_product(self.laptop, 1)
+        self.cart.add_product(self.phone, 2)
+    def test_totals_follow_cart_changes(self):
+        self.assertEqual(self.cart.calculate_total(), 2000.0)
+        self.assertEqual(self.cart.item_count, 3)
+        self.cart.add_product(self.phone, 4)
+        self.assertEqual(self.cart.calculate_total(), 3000.0)
+        self.cart.remove_product(self.laptop)
+        self.assertEqual(self.cart.calculate_total(), 2000.0)
+        self.assertEqual(self.cart.item_count, 4)
+        self.cart.submit_cart_order()
+        self.assertEqual(self.cart.calculate_total(), 0)
+        self.assertEqual(self.cart.item_count, 0)
+    def test_price_change_updates_carts(self):
+        other_cart = ShoppingCart()
+        other_cart.add_product(self.phone, 3)
+        self.phone.price = 600.0
+        self.assertEqual(self.cart.calculate_total(), 2200.0)
+        self.assertEqual(other_cart.calculate_total(), 1800.0)
+        self.cart.remove_product(self.phone)
+        self.phone.price = 700.0
+        self.assertEqual(self.cart.calculate_total(), 1000.0)
+        self.assertEqual(other_cart.calculate_total(), 2100.0)
+    def test_equal_product_keeps_the_line_price(self):
+        self.cart.add_product(Product(name='Phone', price=1.0, available_amount=10), 3)
+        self.assertEqual(self.cart.calculate_total(), sum(p.price * count for p, count in self.cart.products.items()))
+        self.phone.price = 600.0
+        self.assertEqual(self.cart.calculate_total(), 2800.0)
+    def test_equal_product_removes_the_line(self):
+        self.cart.remove_product(Product(name='Phone', price=1.0, available_amount=10))
+        self.assertEqual(self.cart.calculate_total(), 1000.0)
+        self.phone.price = 600.0
+        self.assertEqual(self.cart.calculate_total(), 1000.0)
+    def test_readded_product_is_repriced_once(self):
+        other_carts = [ShoppingCart() for _ in range(3)]
+        for other_cart in other_carts:
+            other_cart.add_product(self.phone, 1)
+        for _ in range(20):
+            self.cart.remove_product(self.phone)
+            self.cart.add_product(self.phone, 2)
+        self.phone.price = 600.0
+        self.assertEqual(self.cart.calculate_total(), 2200.0)
+        self.assertEqual([cart.calculate_total() for cart in other_carts], [600.0] * 3)
+class TestCentsPricing(unittest.TestCase):
+    def test_totals_are_exact(self):
+        cart = ShoppingCart()
+        for index in range(10):
+            cart.add_product(Product(name=f'Item {index}', price=0.1, available_amount=10), 1)
+        cart.add_product(Product(name='Coffee', price='2.675', available_amount=10), 3)
+        self.assertEqual(cart.calculate_total_cents(), 100 + 804)
+        self.assertEqual(cart.calculate_total(), 9.04)
+        self.assertNotEqual(sum([0.1] * 10) + 2.68 * 3, 9.04)
+    def test_price_accessors(self):
+        product = Product(name='Test', price=Decimal('19.999'), available_amount=1)
+        self.assertEqual(product.price_cents, 2000)
+        self.assertEqual(product.price, 20.0)
+        product.price_cents = 1999
+        self.assertEqual(product.price, 19.99)
+class TestBatchPricing(unittest.TestCase):
+    def setUp(self):
+        self.laptop = Product(name='Laptop', price=999.99, available_amount=50)
+        self.phone = Product(name='Phone', price=0.1, available_amount=50)
+        self.carts = [ShoppingCart() for _ in range(4)]
+        self.carts[0].add_product(self.laptop, 1)
+        self.carts[0].add_product(self.phone, 3)
+        self.carts[2].add_product(self.phone, 7)
+        self.carts[3].add_product(self.laptop, 2)
+    def test_totals_match_the_carts(self):
+        self.assertEqual(list(price_carts(self.carts)), [cart.calculate_total_cents() for cart in self.carts])
+    def test_what_if_prices(self):
+        batch = CartPricingBatch(self.carts)
+        prices = batch.price_vector()
+        prices[batch.index_of(self.phone)] = 20
+        self.assertEqual(list(batch.totals_cents(prices)), [99999 + 60, 0, 140, 199998])
+        self.assertEqual(list(batch.totals()), [cart.calculate_total() for cart in self.carts])
+    def test_equal_products_keep_their_own_prices(self):
+        carts = [ShoppingCart(), ShoppingCart(), ShoppingCart()]
+        carts[0].add_product(Product(name='X', price=1, available_amount=1), 1)
+        carts[1].add_product(Product(name='X', price=5, available_amount=1), 1)
+        self.assertEqual(list(price_carts(carts)), [100, 500, 0])
+class TestSlots(unittest.TestCase):
+    def test_no_instance_dict(self):
+        cart = ShoppingCart()
+        for instance in (cart, Order(cart, None, 'order'), Shipment('shipping', None, 'created')):
+            self.assertFalse(hasattr(instance, '__dict__'))
+        self.assertEqual(Shipment('shipping', None).status, None)
+        self.assertEqual(Order(cart, None, 'order'), Order(cart, None, 'order'))
+    def test_names_interned_and_equality_unchanged(self):
+        first = Product(name=''.join(['Lap', 'top']), price=1, available_amount=1)
+        second = Product(name=''.join(['Lap', 'top']), price=2, available_amount=2)
+        self.assertIs(first.name, second.name)
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+class TestProductCatalog(unittest.TestCase):
+    def setUp(self):
+        self.catalog = ProductCatalog(capacity=2)
+        for index in range(5):
+            self.catalog.add(f'Product {index}', 10.5 * index, index)
+    def test_views_work_in_carts(self):
+        product = self.catalog.get('Product 3')
+        self.assertIs(product, self.catalog.get('Product 3'))
+        self.assertEqual(product, Product(name='Product 3', price=0, available_amount=0))
+        cart = ShoppingCart()
+        cart.add_product(product, 2)
+        product.price = 1.25
+        self.assertEqual(cart.calculate_total_cents(), 250)
+        self.assertEqual(self.catalog.price_cents[3], 125)
+        self.assertEqual(cart.submit_cart_order(), ['Product 3'])
+        self.assertEqual(self.catalog.available_amounts[3], 1)
+        with self.assertRaises(ValueError):
+            cart.add_product(product, 2)
+    def test_set_prices_reprices_carts(self):
+        cart = ShoppingCart()
+        cart.add_product(self.catalog.get('Product 2'), 2)
+        cart.add_product(self.catalog.get('Product 3'), 1)
+        self.catalog.set_prices([2, 3, 4], [999, 2100, 5])
+        self.assertEqual(cart.calculate_total_cents(), 2 * 999 + 2100)
+        self.assertEqual(self.catalog.price_cents.tolist(), [0, 1050, 999, 2100, 5])
+        with self.assertRaises(ValueError):
+            self.catalog.price_cents[1] = 100
+        self.assertFalse(isinstance(self.catalog.get('Product 1'), Product))
+    def test_vectorized_availability(self):
+        self.assertEqual(self.catalog.are_available(['Product 0', 'Product 4', 'Product 2'], [0, 5, 2]).tolist(),
+                         [True, False, True])
+        self.assertEqual(len(ProductCatalog.from_products([Product('A', 1, 1), Product('B', 2, 2)])), 2)
 if __name__ == '__main__':
     unittest.main()
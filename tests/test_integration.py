@@ -3,11 +3,30 @@ import uuid
 import boto3
 from app.eshop import Product, ShoppingCart, Order
 import random
-from services import ShippingService
-from services.repository import ShippingRepository
-from services.publisher import ShippingPublisher
+from services import ShippingService, ShippingNotFoundError
+from services.repository import ShippingRepository, batch_get_items, batch_write_items
+from services.publisher import ShippingPublisher, ShippingMessage, VisibilityHeartbeat, clear_queue_urls
+from services.outbox import ShippingOutboxRelay
+from services.worker import ShippingWorker
+from services.cache import CachedShippingRepository, TTLCache
+from services.client_repository import ClientShippingRepository
+from services.backfill import ShippingDateBackfill
+from services.dates import encode_date, decode_date
+from services.product_ids import encode_product_ids, decode_product_ids
+from services.memory import MemoryShippingRepository, MemoryQueue, reset_memory_backend
+from services.backends import create_repository, create_publisher
+from services.sqlite_repository import SqliteShippingRepository
+from services.write_behind import WriteBehindShippingRepository
+from services.singleflight import SingleFlightShippingRepository
+import threading
+import time
+import sqlite3
+from decimal import Decimal
+from botocore.exceptions import ClientError
 from datetime import datetime, timedelta, timezone
 from services.config import AWS_ENDPOINT_URL, AWS_REGION, SHIPPING_QUEUE
+from services.db import get_client, get_dynamodb_resource
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 
 
@@ -67,6 +86,7 @@ def test_place_order_with_unavailable_shipping_type_fails(dynamo_resource):
 
 
 
+@pytest.mark.aws
 def test_when_place_order_then_shipping_in_queue(dynamo_resource):
     shipping_service = ShippingService(ShippingRepository(), ShippingPublisher())
     cart = ShoppingCart()
@@ -150,6 +170,7 @@ def test_complete_shipping(order, shipping_service):
     assert response["HTTPStatusCode"] == 200
 
 
+@pytest.mark.aws
 def test_fail_shipping(order, shipping_service):
     shipping_type = "Самовивіз"
     future_due_date = datetime.now(timezone.utc) + timedelta(days=1)
@@ -176,6 +197,7 @@ def test_product_quantity_after_order(order):
     assert product.available_amount < initial_quantity
 
 
+@pytest.mark.aws
 def test_shipping_message_sent(mocker, shopping_cart):
     mock_publisher = mocker.Mock()
     mock_publisher.send_new_shipping.return_value = "mock_message_id"
@@ -189,4 +211,788 @@ def test_shipping_message_sent(mocker, shopping_cart):
 
     shipping_id = order.place_order(shipping_type, due_date=due_date)
 
-    mock_publisher.send_new_shipping.assert_called_once_with(shipping_id)
\ No newline at end of file
+    mock_publisher.send_new_shipping.assert_called_once_with(shipping_id)
+
+def test_create_shippings_in_bulk(shipping_service):
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    requests = [
+        {"shipping_type": "Нова Пошта", "product_ids": ["Product"], "order_id": str(uuid.uuid4()), "due_date": due_date}
+        for _ in range(30)
+    ]
+    requests.append({"shipping_type": "Fake Express", "product_ids": ["Product"], "order_id": "invalid", "due_date": due_date})
+
+    results = shipping_service.create_shippings(requests)
+
+    assert len(results) == len(requests)
+    assert "Shipping type is not available" in str(results[-1]["error"])
+    for result in results[:-1]:
+        assert result["error"] is None
+        assert shipping_service.check_status(result["shipping_id"]) == shipping_service.SHIPPING_IN_PROGRESS
+
+
+@pytest.mark.aws
+def test_single_write_mode_creates_shipping_in_progress(mocker, shopping_cart):
+    repository = ShippingRepository()
+    put_item = mocker.spy(repository.table, "put_item")
+    update_item = mocker.spy(repository.table, "update_item")
+    shipping_service = ShippingService(repository, ShippingPublisher(), ShippingService.CREATE_MODE_SINGLE_WRITE)
+    order = Order(cart=shopping_cart, shipping_service=shipping_service, order_id=str(uuid.uuid4()))
+
+    shipping_id = order.place_order("Нова Пошта", datetime.now(timezone.utc) + timedelta(days=1))
+
+    assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_IN_PROGRESS
+    assert put_item.call_count == 1
+    update_item.assert_not_called()
+
+
+@pytest.mark.aws
+def test_outbox_mode_publishes_through_relay(mocker, shopping_cart):
+    repository = ShippingRepository()
+    publisher = ShippingPublisher()
+    send_new_shippings = mocker.spy(publisher, "send_new_shippings")
+    shipping_service = ShippingService(repository, publisher, ShippingService.CREATE_MODE_OUTBOX)
+    order = Order(cart=shopping_cart, shipping_service=shipping_service, order_id=str(uuid.uuid4()))
+
+    shipping_id = order.place_order("Нова Пошта", datetime.now(timezone.utc) + timedelta(days=1))
+
+    assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_IN_PROGRESS
+    records, _ = repository.get_outbox()
+    assert [record["shipping_id"] for record in records] == [shipping_id]
+
+    assert shipping_id not in shipping_service.find_shippings_by_product("Laptop", fields=["shipping_id"])
+    assert ShippingOutboxRelay(repository, publisher).drain() == 1
+    send_new_shippings.assert_called_once_with([shipping_id])
+    assert shipping_id in [shipping["shipping_id"]
+                           for shipping in shipping_service.find_shippings_by_product("Laptop", fields=["shipping_id"])]
+    assert repository.get_outbox() == ([], None)
+
+
+def test_outbox_relay_does_not_get_stuck_on_failing_records(mocker):
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    mock_repo.get_outbox.side_effect = [
+        ([{"shipping_id": "rejected"}], {"shipping_id": "rejected"}),
+        ([{"shipping_id": "shipping_2"}], None),
+    ]
+    mock_repo.get_shippings.side_effect = lambda shipping_ids, fields: {
+        shipping_id: {"shipping_id": shipping_id, "product_ids": []} for shipping_id in shipping_ids
+    }
+    mock_publisher.send_new_shippings.side_effect = lambda shipping_ids: {
+        shipping_id: "message" for shipping_id in shipping_ids if shipping_id != "rejected"
+    }
+
+    assert ShippingOutboxRelay(mock_repo, mock_publisher, batch_size=1).drain() == 1
+
+    mock_repo.get_outbox.assert_called_with(1, {"shipping_id": "rejected"})
+    mock_repo.delete_outbox.assert_called_with(["shipping_2"])
+
+
+def test_process_shipping_batch_reads_shippings_in_one_call(mocker, shipping_service):
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    shipping_ids = [
+        shipping_service.repository.create_shipping("Нова Пошта", ["Product"], str(uuid.uuid4()),
+                                                    shipping_service.SHIPPING_IN_PROGRESS, due_date)
+        for _ in range(3)
+    ]
+    mocker.patch.object(shipping_service.publisher, "poll_shipping_messages", return_value=[
+        ShippingMessage(shipping_id, f"receipt_{shipping_id}") for shipping_id in shipping_ids
+    ])
+    acknowledge_shippings = mocker.patch.object(shipping_service.publisher, "acknowledge_shippings")
+    get_shipping = mocker.spy(shipping_service.repository, "get_shipping")
+    get_shippings = mocker.spy(shipping_service.repository, "get_shippings")
+
+    results = shipping_service.process_shipping_batch()
+
+    assert [result["shipping_id"] for result in results] == shipping_ids
+    assert [result["response"]["HTTPStatusCode"] for result in results] == [200, 200, 200]
+    get_shippings.assert_called_once_with(shipping_ids, fields=shipping_service.PROCESS_FIELDS)
+    get_shipping.assert_not_called()
+    acknowledge_shippings.assert_called_once_with([f"receipt_{shipping_id}" for shipping_id in shipping_ids])
+    for shipping_id in shipping_ids:
+        assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_COMPLETED
+
+
+def test_shipping_worker_processes_polled_shippings(mocker):
+    shipping_service = mocker.Mock()
+    shipping_service.publisher.poll_shipping_messages.side_effect = lambda: [
+        ShippingMessage("shipping_1", "receipt_1"), ShippingMessage("shipping_2", "receipt_2")
+    ]
+    shipping_service.publisher.acknowledge_shippings.return_value = []
+    shipping_service.should_acknowledge.side_effect = lambda message, result: result["error"] is None
+    worker = ShippingWorker(shipping_service, pollers=1, processors=2, stats_interval=0.01)
+
+    def process_shipping_messages(messages):
+        worker.stop()
+        return [
+            {"shipping_id": message.shipping_id, "response": {}, "error": None if message.shipping_id == "shipping_1" else KeyError()}
+            for message in messages
+        ]
+    shipping_service.process_shipping_messages.side_effect = process_shipping_messages
+
+    worker.run()
+
+    assert worker.processed >= 1
+    assert worker.failed == worker.processed
+    shipping_service.process_shipping.assert_not_called()
+    acknowledged = [
+        receipt_handle
+        for call in shipping_service.publisher.acknowledge_shippings.call_args_list
+        for receipt_handle in call.args[0]
+    ]
+    assert set(acknowledged) == {"receipt_1"}
+    assert len(acknowledged) == worker.processed
+
+
+def test_process_shipping_batch_keeps_failed_messages(mocker):
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    shipping_service = ShippingService(mock_repo, mock_publisher)
+    due_date = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    mock_publisher.poll_shipping_messages.return_value = [
+        ShippingMessage("shipping_1", "receipt_1"), ShippingMessage("shipping_2", "receipt_2")
+    ]
+    mock_repo.get_shippings.return_value = {"shipping_1": {"due_date": due_date}}
+    mock_repo.update_shipping_status.return_value = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    results = shipping_service.process_shipping_batch()
+
+    assert results[0]["error"] is None
+    assert results[0]["response"]["HTTPStatusCode"] == 200
+    assert results[1]["response"] is None
+    assert isinstance(results[1]["error"], ShippingNotFoundError)
+    mock_publisher.acknowledge_shippings.assert_called_once_with(["receipt_1"])
+
+
+def test_acknowledge_shippings(shipping_service):
+    publisher = shipping_service.publisher
+    publisher.send_new_shippings([str(uuid.uuid4()) for _ in range(12)])
+
+    messages = publisher.poll_shipping_messages()
+    assert messages
+
+    assert publisher.acknowledge_shippings([message.receipt_handle for message in messages]) == []
+
+
+def test_shipping_worker_retries_failed_acknowledgement(mocker):
+    shipping_service = mocker.Mock()
+    shipping_service.publisher.poll_shipping_messages.side_effect = lambda: [ShippingMessage("shipping_1", "receipt_1")]
+    shipping_service.publisher.acknowledge_shippings.side_effect = [ConnectionError(), [], [], [], []]
+    worker = ShippingWorker(shipping_service, pollers=1, processors=1, acknowledge_interval=0.01)
+
+    def process_shipping_messages(messages):
+        worker.stop()
+        return [{"shipping_id": message.shipping_id, "response": {}, "error": None} for message in messages]
+    shipping_service.process_shipping_messages.side_effect = process_shipping_messages
+
+    worker.run()
+
+    first_call, second_call = shipping_service.publisher.acknowledge_shippings.call_args_list[:2]
+    assert second_call.args[0][:len(first_call.args[0])] == first_call.args[0]
+
+
+def test_create_shippings_reports_failed_write_chunk(mocker):
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    shipping_service = ShippingService(mock_repo, mock_publisher)
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    mock_repo.build_shipping_items.side_effect = lambda shippings, status: [
+        {"shipping_id": f"shipping_{index}", "shipping_status": status} for index in range(len(shippings))
+    ]
+    mock_repo.put_shippings.side_effect = [None, ConnectionError("write failed"), None]
+    mock_publisher.send_new_shippings.side_effect = lambda shipping_ids: {shipping_id: "message" for shipping_id in shipping_ids}
+
+    results = shipping_service.create_shippings([
+        {"shipping_type": "Нова Пошта", "product_ids": ["Product"], "order_id": str(index), "due_date": due_date}
+        for index in range(30)
+    ])
+
+    assert [result["error"] is None for result in results] == [True] * 25 + [False] * 5
+    assert results[0]["shipping_id"] == "shipping_0"
+    assert results[-1]["shipping_id"] is None
+    mock_publisher.send_new_shippings.assert_called_once_with([f"shipping_{index}" for index in range(25)])
+
+
+def test_process_shipping_batch_drops_message_for_never_written_shipping(mocker):
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    shipping_service = ShippingService(mock_repo, mock_publisher, ShippingService.CREATE_MODE_SINGLE_WRITE)
+    now = datetime.now(timezone.utc).timestamp()
+    mock_publisher.poll_shipping_messages.return_value = [
+        ShippingMessage("shipping_1", "receipt_1", now),
+        ShippingMessage("shipping_2", "receipt_2", now - ShippingService.MISSING_SHIPPING_GRACE_SECONDS - 1)
+    ]
+    mock_repo.get_shippings.return_value = {}
+    mock_repo.get_shipping.return_value = None
+
+    results = shipping_service.process_shipping_batch()
+
+    assert all(isinstance(result["error"], ShippingNotFoundError) for result in results)
+    mock_publisher.acknowledge_shippings.assert_called_once_with(["receipt_2"])
+
+
+@pytest.mark.aws
+def test_get_shippings_returns_items_read_before_retries_run_out(mocker, shipping_service):
+    repository = shipping_service.repository
+    table_name = repository.table.name
+    mocker.patch("services.repository.time.sleep")
+    mocker.patch.object(repository.client, "batch_get_item", return_value={
+        "Responses": {table_name: [{"shipping_id": "shipping_1"}]},
+        "UnprocessedKeys": {table_name: {"Keys": [{"shipping_id": "shipping_2"}]}}
+    })
+
+    assert repository.get_shippings(["shipping_1", "shipping_2"], max_attempts=2) == {
+        "shipping_1": {"shipping_id": "shipping_1"}
+    }
+
+
+def test_process_shipping_batch_releases_failed_messages(mocker):
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    shipping_service = ShippingService(mock_repo, mock_publisher)
+    due_date = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    mock_publisher.poll_shipping_messages.return_value = [
+        ShippingMessage("shipping_1", "receipt_1"), ShippingMessage("shipping_2", "receipt_2")
+    ]
+    mock_repo.get_shippings.return_value = {"shipping_1": {"due_date": due_date}, "shipping_2": {"due_date": due_date}}
+    mock_repo.update_shipping_status.side_effect = [ConnectionError("throttled"), ConnectionError("throttled")]
+
+    shipping_service.process_shipping_batch()
+
+    mock_publisher.acknowledge_shippings.assert_called_once_with([])
+    mock_publisher.release_shippings.assert_called_once_with(["receipt_1", "receipt_2"])
+
+
+def test_process_shipping_batch_extends_visibility_while_processing(mocker):
+    mock_repo = mocker.Mock()
+    mock_publisher = mocker.Mock()
+    mock_publisher.change_visibility.return_value = []
+    shipping_service = ShippingService(mock_repo, mock_publisher)
+    due_date = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    mock_publisher.poll_shipping_messages.return_value = [ShippingMessage("shipping_1", "receipt_1")]
+
+    def slow_read(shipping_ids, fields):
+        shipping_service.heartbeat.extend()
+        return {"shipping_1": {"due_date": due_date}}
+
+    mock_repo.get_shippings.side_effect = slow_read
+    mock_repo.update_shipping_status.return_value = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+    shipping_service.process_shipping_batch()
+    shipping_service.heartbeat.extend()
+    shipping_service.close()
+
+    mock_publisher.change_visibility.assert_called_once_with(["receipt_1"], shipping_service.heartbeat.visibility_timeout)
+    mock_publisher.acknowledge_shippings.assert_called_once_with(["receipt_1"])
+
+
+def test_visibility_heartbeat_extends_tracked_messages(shipping_service):
+    publisher = shipping_service.publisher
+    publisher.send_new_shippings([str(uuid.uuid4())])
+    messages = publisher.poll_shipping_messages(batch_size=1)
+    receipt_handles = [message.receipt_handle for message in messages]
+
+    heartbeat = VisibilityHeartbeat(publisher, visibility_timeout=60)
+    heartbeat.track(receipt_handles)
+    heartbeat.extend()
+
+    assert publisher.release_shippings(receipt_handles) == []
+    heartbeat.untrack(receipt_handles)
+    publisher.acknowledge_shippings([message.receipt_handle for message in publisher.poll_shipping_messages()])
+
+
+def test_clients_are_shared_and_resources_are_per_thread():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        clients = list(executor.map(lambda _: get_client("sqs"), range(8)))
+        resources = list(executor.map(lambda _: id(get_dynamodb_resource()), range(8)))
+
+    assert all(client is clients[0] for client in clients)
+    assert ShippingPublisher().client is clients[0]
+    assert get_dynamodb_resource() is get_dynamodb_resource()
+    assert ShippingRepository().table.meta.client is get_dynamodb_resource().meta.client
+    assert 1 <= len(set(resources)) <= 4
+
+
+@pytest.mark.aws
+def test_queue_url_is_resolved_once_per_process(mocker):
+    clear_queue_urls()
+    get_queue_url = mocker.spy(get_client("sqs"), "get_queue_url")
+    create_queue = mocker.spy(get_client("sqs"), "create_queue")
+
+    publishers = [ShippingPublisher() for _ in range(3)]
+    get_queue_url.assert_not_called()
+
+    assert len({publisher.queue_url for publisher in publishers}) == 1
+    get_queue_url.assert_called_once_with(QueueName=SHIPPING_QUEUE)
+    create_queue.assert_not_called()
+
+
+@pytest.mark.aws
+def test_missing_queue_is_created_only_when_enabled():
+    queue_name = f"ShippingQueue-{uuid.uuid4()}"
+
+    with pytest.raises(get_client("sqs").exceptions.QueueDoesNotExist):
+        ShippingPublisher(queue_name).queue_url
+
+    queue_url = ShippingPublisher(queue_name, auto_create=True).queue_url
+    assert queue_url.endswith(queue_name)
+    get_client("sqs").delete_queue(QueueUrl=queue_url)
+
+
+@pytest.mark.aws
+def test_cached_repository_serves_repeated_status_checks_from_cache(mocker, order):
+    repository = CachedShippingRepository(ShippingRepository(), ttl=60)
+    shipping_service = ShippingService(repository, ShippingPublisher())
+    order.shipping_service = shipping_service
+    shipping_id = order.place_order("Нова Пошта", datetime.now(timezone.utc) + timedelta(days=1))
+    get_item = mocker.spy(repository.repository.client, "get_item")
+
+    for _ in range(5):
+        assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_IN_PROGRESS
+    assert get_item.call_count == 1
+
+    shipping_service.complete_shipping(shipping_id)
+    assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_COMPLETED
+    assert get_item.call_count == 2
+    assert repository.stats()["hits"] == 4
+
+
+def test_ttl_cache_expires_and_evicts():
+    now = [0.0]
+    cache = TTLCache(max_size=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 1, "size": 1}
+
+
+def test_cached_repository_does_not_store_reads_raced_by_writes(mocker):
+    mock_repo = mocker.Mock()
+    repository = CachedShippingRepository(mock_repo, ttl=60)
+
+    def read_while_updated(shipping_id, fields, consistent_read):
+        repository.update_shipping_status(shipping_id, "completed")
+        return {"shipping_id": shipping_id, "shipping_status": "in progress"}
+
+    mock_repo.get_shipping.side_effect = read_while_updated
+    assert repository.get_shipping("shipping_1")["shipping_status"] == "in progress"
+    mock_repo.get_shipping.side_effect = lambda shipping_id, fields, consistent_read: {
+        "shipping_id": shipping_id, "shipping_status": "completed"
+    }
+    assert repository.get_shipping("shipping_1")["shipping_status"] == "completed"
+    repository.get_shipping("shipping_1")["shipping_status"] = "changed by the caller"
+    assert repository.get_shipping("shipping_1")["shipping_status"] == "completed"
+    assert mock_repo.get_shipping.call_count == 2
+
+
+def test_ttl_cache_forgets_old_invalidations_safely():
+    cache = TTLCache(max_size=1, ttl=10)
+    generation = cache.generation()
+    cache.invalidate("a")
+    cache.invalidate("b")
+
+    assert not cache.set("a", 1, generation)
+    assert cache.set("a", 1, cache.generation())
+
+
+@pytest.mark.aws
+def test_status_reads_fetch_only_the_status(mocker, order, shipping_service):
+    shipping_id = order.place_order("Нова Пошта", datetime.now(timezone.utc) + timedelta(days=1))
+    get_item = mocker.spy(shipping_service.repository.client, "get_item")
+
+    assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_IN_PROGRESS
+    assert shipping_service.repository.get_shipping(shipping_id, fields=["shipping_status"]) == {
+        "shipping_status": shipping_service.SHIPPING_IN_PROGRESS
+    }
+    assert get_item.call_args_list[0].kwargs["ConsistentRead"] is False
+    assert get_item.call_args_list[0].kwargs["ExpressionAttributeNames"] == {"#f0": "shipping_status"}
+    assert "product_ids" in shipping_service.repository.get_shipping(shipping_id, consistent_read=True)
+
+
+@pytest.mark.aws
+@pytest.mark.parametrize("create_mode", [
+    ShippingService.CREATE_MODE_TWO_PHASE, ShippingService.CREATE_MODE_SINGLE_WRITE, ShippingService.CREATE_MODE_OUTBOX
+])
+def test_client_repository_is_interchangeable(mocker, shopping_cart, create_mode):
+    repository = ClientShippingRepository()
+    shipping_service = ShippingService(repository, ShippingPublisher(), create_mode)
+    order = Order(cart=shopping_cart, shipping_service=shipping_service, order_id=str(uuid.uuid4()))
+    shipping_id = order.place_order("Нова Пошта", datetime.now(timezone.utc) + timedelta(days=1))
+
+    assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_IN_PROGRESS
+    assert repository.get_shipping(shipping_id) == ShippingRepository().get_shipping(shipping_id)
+
+    mocker.patch.object(shipping_service.publisher, "poll_shipping_messages",
+                        return_value=[ShippingMessage(shipping_id, "receipt")])
+    mocker.patch.object(shipping_service.publisher, "acknowledge_shippings")
+    results = shipping_service.process_shipping_batch()
+
+    assert results[0]["error"] is None
+    assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_COMPLETED
+
+
+def test_fail_overdue_shippings(shipping_service):
+    repository = shipping_service.repository
+    due_date = datetime.now(timezone.utc) + timedelta(hours=1)
+    overdue = [
+        repository.create_shipping("Нова Пошта", ["Product"], str(uuid.uuid4()), shipping_service.SHIPPING_IN_PROGRESS, due_date)
+        for _ in range(3)
+    ]
+    completed = repository.create_shipping("Нова Пошта", ["Product"], str(uuid.uuid4()),
+                                           shipping_service.SHIPPING_COMPLETED, due_date)
+    later = repository.create_shipping("Нова Пошта", ["Product"], str(uuid.uuid4()),
+                                       shipping_service.SHIPPING_IN_PROGRESS, due_date + timedelta(days=2))
+    now = due_date + timedelta(days=1)
+
+    found = [shipping["shipping_id"] for shipping in repository.iter_overdue(now, shipping_service.SHIPPING_IN_PROGRESS, page_size=2)]
+    assert set(overdue) <= set(found)
+    assert completed not in found and later not in found
+
+    assert shipping_service.fail_overdue_shippings(now, page_size=2) >= 3
+    for shipping_id in overdue:
+        assert shipping_service.check_status(shipping_id, consistent_read=True) == shipping_service.SHIPPING_FAILED
+    assert shipping_service.check_status(completed) == shipping_service.SHIPPING_COMPLETED
+    assert shipping_service.check_status(later) == shipping_service.SHIPPING_IN_PROGRESS
+    assert not repository.update_shipping_status_if(completed, shipping_service.SHIPPING_FAILED,
+                                                    shipping_service.SHIPPING_IN_PROGRESS)
+
+
+def test_dates_round_trip_in_both_formats():
+    due_date = datetime(2025, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc)
+
+    assert decode_date(encode_date(due_date, "iso")) == due_date
+    assert decode_date(encode_date(due_date, "epoch")) == due_date
+
+
+@pytest.mark.aws
+@pytest.mark.parametrize("repository_class", [ShippingRepository, ClientShippingRepository])
+def test_epoch_dates_are_processed(mocker, repository_class):
+    mocker.patch("services.dates.SHIPPING_DATE_FORMAT", "epoch")
+    shipping_service = ShippingService(repository_class(), ShippingPublisher())
+    overdue = shipping_service.repository.create_shipping(
+        "Нова Пошта", ["Product"], str(uuid.uuid4()), shipping_service.SHIPPING_IN_PROGRESS,
+        datetime.now(timezone.utc) - timedelta(minutes=1)
+    )
+    pending = shipping_service.repository.create_shipping(
+        "Нова Пошта", ["Product"], str(uuid.uuid4()), shipping_service.SHIPPING_IN_PROGRESS,
+        datetime.now(timezone.utc) + timedelta(days=1)
+    )
+
+    assert not isinstance(shipping_service.repository.get_shipping(overdue)["due_date"], str)
+    shipping_service.process_shipping(overdue)
+    shipping_service.process_shipping(pending)
+    assert shipping_service.check_status(overdue) == shipping_service.SHIPPING_FAILED
+    assert shipping_service.check_status(pending) == shipping_service.SHIPPING_COMPLETED
+
+
+@pytest.mark.aws
+def test_backfill_rewrites_iso_dates(shipping_service):
+    repository = shipping_service.repository
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    shipping_id = repository.create_shipping("Нова Пошта", ["Product"], str(uuid.uuid4()),
+                                             shipping_service.SHIPPING_IN_PROGRESS, due_date)
+    repository.client.update_item(TableName=repository.table.name, Key={"shipping_id": shipping_id},
+                                  UpdateExpression="REMOVE due_epoch")
+
+    assert ShippingDateBackfill(repository, segments=2, dry_run=True).run()["updated"] >= 1
+    assert isinstance(repository.get_shipping(shipping_id)["due_date"], str)
+
+    ShippingDateBackfill(repository, segments=2, writes_per_second=1000).run()
+    shipping = repository.get_shipping(shipping_id, consistent_read=True)
+    assert abs(decode_date(shipping["due_date"]) - due_date) <= timedelta(milliseconds=1)
+    assert shipping["due_epoch"] > 0
+    assert ShippingDateBackfill.build_update(shipping) is None
+
+    shipping_service.process_shipping(shipping_id)
+    assert shipping_service.check_status(shipping_id) == shipping_service.SHIPPING_COMPLETED
+
+
+def test_backfill_updates_only_existing_items():
+    update = ShippingDateBackfill.build_update({"shipping_id": "shipping_1", "due_date": Decimal("1700000000.5")})
+
+    assert update["UpdateExpression"] == "SET due_epoch = :due_epoch"
+    assert update["ConditionExpression"] == "attribute_exists(shipping_id)"
+
+
+def test_batch_helpers_retry_unprocessed_requests(mocker):
+    mocker.patch("services.repository.time.sleep")
+    client = mocker.Mock()
+    client.batch_get_item.side_effect = [
+        {"Responses": {"table": [{"id": "1"}]}, "UnprocessedKeys": {"table": {"Keys": [{"id": "2"}]}}},
+        {"Responses": {"table": [{"id": "2"}]}},
+    ]
+    client.batch_write_item.return_value = {"UnprocessedItems": {"table": [{"PutRequest": {"Item": {"id": "1"}}}]}}
+
+    assert batch_get_items(client, "table", [{"id": "1"}, {"id": "2"}], dict) == [{"id": "1"}, {"id": "2"}]
+    client.batch_get_item.assert_called_with(RequestItems={"table": {"Keys": [{"id": "2"}]}})
+    with pytest.raises(RuntimeError):
+        batch_write_items(client, "table", [{"PutRequest": {"Item": {"id": "1"}}}], max_attempts=3)
+    assert client.batch_write_item.call_count == 3
+
+
+def test_product_ids_encodings():
+    product_ids = ["Laptop, 15 inch", "Phone"]
+
+    assert encode_product_ids(product_ids) == product_ids
+    assert decode_product_ids(encode_product_ids(product_ids * 10, pack_threshold=5)) == product_ids * 10
+    assert decode_product_ids("Laptop,Phone") == ["Laptop", "Phone"]
+
+
+@pytest.mark.aws
+@pytest.mark.parametrize("repository_class", [ShippingRepository, ClientShippingRepository])
+def test_product_ids_are_stored_natively_and_indexed(mocker, repository_class):
+    shipping_service = ShippingService(repository_class(), ShippingPublisher())
+    repository = shipping_service.repository
+    product = f"Laptop, {uuid.uuid4()}"
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    unindexed_id = repository.create_shipping("Нова Пошта", [product], str(uuid.uuid4()),
+                                              shipping_service.SHIPPING_IN_PROGRESS, due_date)
+    shipping_id = shipping_service.create_shipping("Нова Пошта", [product, "Phone"], str(uuid.uuid4()), due_date)
+    mocker.patch("services.product_ids.SHIPPING_PRODUCT_IDS_PACK_THRESHOLD", 2)
+    large_ids = [product] + [f"Product {index}" for index in range(10)]
+    large_id = shipping_service.create_shippings([
+        {"shipping_type": "Нова Пошта", "product_ids": large_ids, "order_id": str(uuid.uuid4()), "due_date": due_date}
+    ])[0]["shipping_id"]
+    shipping_service.wait_for_index()
+
+    raw = repository.client.get_item(TableName=repository.table.name, Key={"shipping_id": shipping_id})["Item"]
+    assert raw["product_ids"] == [product, "Phone"]
+    assert repository.get_shipping(shipping_id)["product_ids"] == [product, "Phone"]
+    assert list(repository.get_shippings([large_id])[large_id]["product_ids"]) == large_ids
+    assert sorted(item["shipping_id"] for item in repository.client.scan(
+        TableName=repository.table.name, FilterExpression="contains(product_ids, :product)",
+        ExpressionAttributeValues={":product": product}
+    )["Items"]) == sorted([unindexed_id, shipping_id])
+
+    # repository writes leave the index to the service, creating a shipping stays a single write
+    found = shipping_service.find_shippings_by_product(product, fields=["shipping_id"])
+    assert sorted(shipping["shipping_id"] for shipping in found) == sorted([shipping_id, large_id])
+
+
+@pytest.mark.aws
+def test_order_shipments_are_queried_by_order(mocker, shipping_service):
+    order = Order(cart=ShoppingCart(), shipping_service=shipping_service, order_id=str(uuid.uuid4()))
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    shipping_ids = {order.place_order("Нова Пошта", due_date) for _ in range(3)}
+    scan = mocker.spy(shipping_service.repository.client, "scan")
+    get_shippings = mocker.spy(shipping_service.repository, "get_shippings")
+
+    items, start_key = shipping_service.repository.get_order_page(order.order_id, limit=2)
+    assert len(items) == 2 and start_key is not None
+    assert {item["shipping_id"] for item in shipping_service.repository.iter_by_order(order.order_id, page_size=1)} == shipping_ids
+
+    assert {shipment.shipping_id for shipment in order.shipments} == shipping_ids
+    assert {shipment.status for shipment in order.shipments} == {shipping_service.SHIPPING_IN_PROGRESS}
+    assert get_shippings.call_count == 1
+    scan.assert_not_called()
+
+    order.place_order("Нова Пошта", due_date)
+    assert len(order.shipments) == 4
+
+
+def test_memory_repository_keeps_conditional_writes():
+    repository = MemoryShippingRepository(f"ShippingTable-{uuid.uuid4()}")
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    shipping_id = repository.create_shipping("Нова Пошта", ["Product"], "order_1", ShippingService.SHIPPING_IN_PROGRESS,
+                                             due_date, shipping_id="shipping_1")
+
+    with pytest.raises(ClientError):
+        repository.create_shipping("Нова Пошта", ["Product"], "order_1", ShippingService.SHIPPING_IN_PROGRESS,
+                                   due_date, shipping_id=shipping_id)
+    outbox_items = repository.build_shipping_items([("Нова Пошта", ["Product"], "order_1", due_date)] * 2,
+                                                   ShippingService.SHIPPING_IN_PROGRESS, ["shipping_2", shipping_id])
+    with pytest.raises(ClientError):
+        repository.put_shippings_with_outbox(outbox_items)
+    assert repository.get_shipping("shipping_2") is None
+    assert repository.get_outbox() == ([], None)
+    assert repository.get_shipping(shipping_id, fields=["shipping_status"]) == {
+        "shipping_status": ShippingService.SHIPPING_IN_PROGRESS
+    }
+    assert not repository.update_shipping_status_if(shipping_id, ShippingService.SHIPPING_FAILED,
+                                                    ShippingService.SHIPPING_COMPLETED)
+    assert repository.get_shippings(["shipping_1", "missing"]).keys() == {"shipping_1"}
+    assert [shipping["shipping_id"] for shipping in repository.iter_overdue(
+        due_date + timedelta(days=1), ShippingService.SHIPPING_IN_PROGRESS
+    )] == ["shipping_1"]
+
+
+def test_memory_queue_redelivers_after_visibility_timeout():
+    now = [0.0]
+    queue = MemoryQueue(visibility_timeout=30, clock=lambda: now[0])
+    queue.send("shipping_1")
+
+    receipt_handle = queue.receive(10, wait_time=0)[0]["receipt_handle"]
+    assert queue.receive(10, wait_time=0) == []
+    now[0] = 31
+    redelivered = queue.receive(10, wait_time=0)[0]
+    assert redelivered["receipt_handle"] != receipt_handle
+
+    assert queue.change_visibility(redelivered["receipt_handle"], 0)
+    released = queue.receive(10, wait_time=0)[0]
+    assert queue.delete(released["receipt_handle"])
+    now[0] = 100
+    assert queue.receive(10, wait_time=0) == []
+
+
+def test_shipping_service_runs_on_memory_backend():
+    reset_memory_backend()
+    shipping_service = ShippingService(create_repository("memory"), create_publisher("memory"))
+    order = Order(cart=ShoppingCart(), shipping_service=shipping_service, order_id=str(uuid.uuid4()))
+    shipping_ids = [order.place_order("Нова Пошта", datetime.now(timezone.utc) + timedelta(days=1)) for _ in range(3)]
+
+    results = shipping_service.process_shipping_batch()
+
+    assert sorted(result["shipping_id"] for result in results) == sorted(shipping_ids)
+    assert {shipment.status for shipment in order.shipments} == {shipping_service.SHIPPING_COMPLETED}
+    shipping_service.publisher.wait_time = 0
+    assert shipping_service.publisher.poll_shipping_messages() == []
+
+
+def test_sqlite_repository_runs_the_shipping_service(tmp_path):
+    repository = SqliteShippingRepository(str(tmp_path / "shipping.db"))
+    shipping_service = ShippingService(repository, create_publisher("memory"))
+    order = Order(cart=ShoppingCart(), shipping_service=shipping_service, order_id=str(uuid.uuid4()))
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    shipping_ids = [order.place_order("Нова Пошта", due_date) for _ in range(3)]
+    results = shipping_service.create_shippings([
+        {"shipping_type": "Нова Пошта", "product_ids": ["Laptop, 15 inch"], "order_id": str(index), "due_date": due_date}
+        for index in range(5)
+    ])
+
+    assert repository.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert len(shipping_service.process_shipping_batch()) == 8
+    shipping_service.wait_for_index()
+    assert {shipment.status for shipment in order.shipments} == {shipping_service.SHIPPING_COMPLETED}
+    assert sorted(repository.get_shippings(shipping_ids, fields=["shipping_id"])) == sorted(shipping_ids)
+    assert repository.get_shipping(results[0]["shipping_id"])["product_ids"] == ["Laptop, 15 inch"]
+    assert len(shipping_service.find_shippings_by_product("Laptop, 15 inch")) == 5
+    with pytest.raises(sqlite3.IntegrityError):
+        repository.create_shipping("Нова Пошта", ["Product"], "order_1", shipping_service.SHIPPING_IN_PROGRESS,
+                                   due_date, shipping_id=shipping_ids[0])
+    repository.close()
+
+
+def test_sqlite_repository_pages_and_transactions(tmp_path):
+    repository = SqliteShippingRepository(str(tmp_path / "shipping.db"))
+    due_date = datetime.now(timezone.utc) + timedelta(hours=1)
+    items = repository.build_shipping_items([("Нова Пошта", ["Product"], "order_1", due_date)] * 5,
+                                            ShippingService.SHIPPING_IN_PROGRESS)
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        list(executor.map(lambda item: repository.put_shippings_with_outbox([item]), items))
+
+    with pytest.raises(sqlite3.IntegrityError):
+        repository.put_shippings_with_outbox(repository.build_shipping_items(
+            [("Нова Пошта", ["Product"], "order_2", due_date)] * 2, ShippingService.SHIPPING_IN_PROGRESS,
+            ["shipping_new", items[0]["shipping_id"]]
+        ))
+    assert repository.get_shipping("shipping_new") is None
+
+    records, start_key = repository.get_outbox(limit=3)
+    assert len(records) == 3 and repository.get_outbox(limit=3, start_key=start_key)[1] is None
+    assert len(list(repository.iter_by_order("order_1", page_size=2))) == 5
+    overdue = list(repository.iter_overdue(due_date + timedelta(days=1), ShippingService.SHIPPING_IN_PROGRESS, page_size=2))
+    assert sorted(shipping["shipping_id"] for shipping in overdue) == sorted(item["shipping_id"] for item in items)
+    assert repository.update_shipping_status_if(items[0]["shipping_id"], ShippingService.SHIPPING_FAILED,
+                                                ShippingService.SHIPPING_IN_PROGRESS)
+    assert not repository.update_shipping_status_if(items[0]["shipping_id"], ShippingService.SHIPPING_FAILED,
+                                                    ShippingService.SHIPPING_IN_PROGRESS)
+    repository.close()
+
+
+def test_write_behind_coalesces_status_updates(mocker):
+    repository = mocker.Mock()
+    repository.get_shipping.side_effect = lambda shipping_id, fields, consistent_read: {"shipping_status": "in progress"}
+    write_behind = WriteBehindShippingRepository(repository, window=60)
+
+    assert write_behind.update_shipping_status("shipping_1", "in progress")["ResponseMetadata"]["HTTPStatusCode"] == 202
+    write_behind.update_shipping_status("shipping_1", "completed")
+    write_behind.update_shipping_status("shipping_2", "failed")
+    assert write_behind.get_shipping("shipping_1", ["shipping_status"], False) == {"shipping_status": "completed"}
+    repository.update_shipping_status.assert_not_called()
+
+    write_behind.close()
+
+    assert sorted(call.args for call in repository.update_shipping_status.call_args_list) == [
+        ("shipping_1", "completed"), ("shipping_2", "failed")
+    ]
+    assert write_behind.stats() == {"pending": 0, "written": 2, "coalesced": 1}
+
+
+def test_write_behind_keeps_failed_statuses_pending(mocker):
+    repository = mocker.Mock()
+    repository.update_shipping_statuses.side_effect = [ConnectionError("throttled"), None]
+    write_behind = WriteBehindShippingRepository(repository, window=60,
+                                                 flush_mode=WriteBehindShippingRepository.FLUSH_MODE_TRANSACTION)
+    write_behind.update_shipping_status("shipping_1", "in progress")
+
+    with pytest.raises(ConnectionError):
+        write_behind.flush()
+    write_behind.update_shipping_status("shipping_1", "completed")
+    write_behind.close()
+
+    repository.update_shipping_statuses.assert_called_with({"shipping_1": "completed"})
+
+
+@pytest.mark.parametrize("flush_mode", [
+    WriteBehindShippingRepository.FLUSH_MODE_PARALLEL, WriteBehindShippingRepository.FLUSH_MODE_TRANSACTION
+])
+def test_write_behind_flushes_before_acknowledging(mocker, shopping_cart, flush_mode):
+    repository = WriteBehindShippingRepository(create_repository(write_behind=False), window=60, flush_mode=flush_mode)
+    shipping_service = ShippingService(repository, create_publisher())
+    order = Order(cart=shopping_cart, shipping_service=shipping_service, order_id=str(uuid.uuid4()))
+    shipping_id = order.place_order("Нова Пошта", datetime.now(timezone.utc) + timedelta(days=1))
+    mocker.patch.object(shipping_service.publisher, "poll_shipping_messages",
+                        return_value=[ShippingMessage(shipping_id, "receipt")])
+    pending_on_acknowledge = []
+    acknowledge_shippings = mocker.patch.object(
+        shipping_service.publisher, "acknowledge_shippings",
+        side_effect=lambda receipt_handles: pending_on_acknowledge.append(repository.stats()["pending"]) or []
+    )
+
+    shipping_service.process_shipping_batch()
+
+    acknowledge_shippings.assert_called_once_with(["receipt"])
+    assert pending_on_acknowledge == [0]
+    assert repository.repository.get_shipping(shipping_id, consistent_read=True)["shipping_status"] == \
+        shipping_service.SHIPPING_COMPLETED
+    shipping_service.close()
+
+
+def test_singleflight_shares_concurrent_reads(mocker):
+    repository = mocker.Mock()
+    release = threading.Event()
+    repository.get_shipping.side_effect = lambda shipping_id, fields, consistent_read: release.wait() and {
+        "shipping_id": shipping_id, "shipping_status": "in progress"
+    }
+    singleflight = SingleFlightShippingRepository(repository)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(singleflight.get_shipping, "shipping_1", ["shipping_status"]) for _ in range(8)]
+        while singleflight.flight.shared + singleflight.flight.calls < 8:
+            time.sleep(0.001)
+        release.set()
+        shippings = [future.result() for future in futures]
+
+    assert repository.get_shipping.call_count == 1
+    assert all(shipping == {"shipping_id": "shipping_1", "shipping_status": "in progress"} for shipping in shippings)
+    assert len({id(shipping) for shipping in shippings}) == 8
+
+
+def test_singleflight_remembers_missing_shippings(shipping_service):
+    repository = SingleFlightShippingRepository(shipping_service.repository, negative_ttl=60)
+    shipping_id = str(uuid.uuid4())
+
+    assert repository.get_shipping(shipping_id) is None
+    assert repository.get_shipping(shipping_id) is None
+    assert repository.stats()["missing_hits"] == 1
+    assert repository.stats()["calls"] == 1
+
+    due_date = datetime.now(timezone.utc) + timedelta(days=1)
+    repository.create_shippings([("Нова Пошта", ["Product"], str(uuid.uuid4()), due_date)],
+                                shipping_service.SHIPPING_IN_PROGRESS, [shipping_id])
+    assert repository.get_shipping(shipping_id)["shipping_status"] == shipping_service.SHIPPING_IN_PROGRESS
+    with pytest.raises(ShippingNotFoundError):
+        ShippingService(repository, shipping_service.publisher).process_shipping(str(uuid.uuid4()))